@@ -1,10 +1,9 @@
-from ..main import get_db
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from ..main import app
-from ..services.commission_service import CommissionService
-from ..repositories.commission_record_repository import CommissionRecordRepository
-from ..repositories.settlement_record_repository import SettlementRecordRepository 
+from ..database.session import read_your_writes
+import json
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from ..services.sharded_commission_service import ShardedCommissionService
+from ..services.stats_broadcaster import stats_broadcaster
 from ..schemas.commission import (
     PageRequest, LinkStatsResponse, PageResponse, UserLinkResponse,
     LinkCommissionDetail, AllLinkInfoResponse, CommissionSettleRequest, CommissionSettleResponse
@@ -16,47 +15,67 @@ link_router = APIRouter(prefix='/link', tags=['邀请链接统计'])
 # 佣金管理路由
 commission_router = APIRouter(prefix='/commission', tags=['佣金管理'])
 
-def get_commission_service(db: Session = Depends(get_db)):
-    commission_repo = CommissionRecordRepository(db)
-    settlement_repo = SettlementRecordRepository(db)
-    return CommissionService(db, commission_repo, settlement_repo)  # 匹配构造函数参数顺序
+# 分片版服务：按用户/链接路由到所属分片的读写连接池，全局统计在各分片上并行查询后合并
+# 以下处理函数（SSE除外）均为同步函数，由FastAPI放入线程池执行，阻塞的数据库查询不占用事件循环
+def get_commission_service():
+    return ShardedCommissionService()
 
 # 1-4 统计接口
 @link_router.get('/stats', response_model=LinkStatsResponse)
-async def get_link_stats(service: CommissionService = Depends(get_commission_service)):
+def get_link_stats(service: ShardedCommissionService = Depends(get_commission_service)):
     return service.get_link_stats()
 
+# 1-4 统计接口（SSE推送）：所有连接共享同一个发布者，替代前端轮询
+@link_router.get('/stats/stream')
+async def stream_link_stats(request: Request):
+    async def event_stream():
+        async for snapshot in stats_broadcaster.subscribe():
+            if await request.is_disconnected():
+                break
+            if snapshot is None:
+                yield ': ping\n\n'  # 心跳，便于及时发现断开的连接
+            else:
+                yield f'data: {json.dumps(snapshot)}\n\n'
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # 5. 个人创建的链接列表
 @link_router.get('/user-links', response_model=PageResponse[UserLinkResponse])
-async def get_user_links(
+def get_user_links(
     user_id: str,
     page_req: PageRequest = Depends(),
-    service: CommissionService = Depends(get_commission_service)
+    service: ShardedCommissionService = Depends(get_commission_service)
 ):
     return service.get_user_links(user_id, page_req)
 
 # 6. 单条链接佣金详情
 @link_router.get('/commission-detail/{link_code}', response_model=LinkCommissionDetail)
-async def get_link_commission_detail(
+def get_link_commission_detail(
     link_code: str,
-    service: CommissionService = Depends(get_commission_service)
+    service: ShardedCommissionService = Depends(get_commission_service)
 ):
     return service.get_link_commission_detail(link_code)
 
 # 7. 所有链接信息（分页）
 @link_router.get('/all', response_model=PageResponse[AllLinkInfoResponse])
-async def get_all_links(
+def get_all_links(
     page_req: PageRequest = Depends(),
-    service: CommissionService = Depends(get_commission_service)
+    service: ShardedCommissionService = Depends(get_commission_service)
 ):
     return service.get_all_links(page_req)
 
 # 佣金结算接口
 @commission_router.post('/settle', response_model=CommissionSettleResponse)
-async def settle_commission(
+def settle_commission(
     request: CommissionSettleRequest,
-    service: CommissionService = Depends(get_commission_service)
+    service: ShardedCommissionService = Depends(get_commission_service)
 ):
     # 仅负责请求转发，业务逻辑由服务层处理
     result = service.settle_commission(user_id=request.user_id)
+    read_your_writes.mark_write(request.user_id)
+    if result['amount']:
+        stats_broadcaster.record_settlement(result['amount'])
     return CommissionSettleResponse(**result)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, Query
+from ..services.leaderboard_service import leaderboard_service, METRICS, WINDOWS
+from ..schemas.leaderboard import LeaderboardResponse, LeaderboardRankResponse
+
+# 邀请排行榜路由
+leaderboard_router = APIRouter(prefix='/leaderboard', tags=['邀请排行榜'])
+
+def _validate(metric: str, window: str):
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f'metric 需为 {"/".join(METRICS)}')
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f'window 需为 {"/".join(WINDOWS)}')
+
+# 排行榜 top-K（直接读内存有序结构）
+@leaderboard_router.get('/top', response_model=LeaderboardResponse)
+async def get_leaderboard_top(
+    metric: str = 'commission',
+    window: str = 'all',
+    limit: int = Query(10, ge=1, le=100)
+):
+    _validate(metric, window)
+    return LeaderboardResponse(metric=metric, window=window, data=leaderboard_service.top(metric, window, limit))
+
+# 指定用户的排名
+@leaderboard_router.get('/rank/{user_id}', response_model=LeaderboardRankResponse)
+async def get_leaderboard_rank(user_id: str, metric: str = 'commission', window: str = 'all'):
+    _validate(metric, window)
+    result = leaderboard_service.rank(user_id, metric, window)
+    if result is None:
+        raise HTTPException(status_code=404, detail='该用户未上榜')
+    return LeaderboardRankResponse(metric=metric, window=window, **result)
\ No newline at end of file
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index, Boolean  # 新增Index导入
+import logging
+
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index, Boolean, inspect, text  # 新增Index导入
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 default=datetime.now
 
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
+
 # 配置表（存储佣金比例、有效期等全局配置）
 class CommissionConfig(Base):
     __tablename__ = 'commission_config'
@@ -24,16 +28,20 @@ class InviteLinkTree(Base):
     link_code = Column(String(50), comment='邀请链接唯一码')
     created_at = Column(DateTime, default=datetime.now)
 
+    # invitee_id 的唯一约束本身即为索引（按被邀请者查节点）
     __table_args__ = (
         Index('idx_inviter_created', 'inviter_id', 'created_at'),  # 已修正：使用导入的Index类
-        Index('idx_link_code', 'link_code', unique=True),
+        # 被邀请者节点沿用邀请者的链接码，同一 link_code 对应多行，不能建唯一索引
+        Index('idx_invite_link_code', 'link_code'),
+        # 按父节点查找下级节点
+        Index('idx_invite_parent', 'parent_id'),
     )
 
 # 结算记录表（用户主动发起的结算操作）
 class SettlementRecord(Base):
     __tablename__ = 'settlement_records'
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String(50), index=True, comment='发起结算的用户ID')  # 修复重复定义
+    user_id = Column(String(50), comment='发起结算的用户ID')  # 修复重复定义
     amount = Column(Float)
     settled_at = Column(DateTime, default=datetime.utcnow)
     total_amount = Column(Float, comment='本次结算总金额')
@@ -41,8 +49,10 @@ class SettlementRecord(Base):
     created_at = Column(DateTime, default=datetime.now)
     completed_at = Column(DateTime, nullable=True, comment='完成时间')
     __table_args__ = (
-        # 加速当日已结算统计（按completed_at过滤）
-        Index('idx_completed_at', 'completed_at'),
+        # 加速按用户查询结算历史（按created_at倒序分页）
+        Index('idx_settlement_user_created', 'user_id', 'created_at'),
+        # 加速当日已结算统计（按completed_at过滤，覆盖total_amount）
+        Index('idx_settlement_completed_at', 'completed_at', 'total_amount'),
     )
 
 # 佣金比例历史表（记录每次管理员设置的比例及生效时间）
@@ -54,6 +64,10 @@ class CommissionRateHistory(Base):
     effective_at = Column(DateTime, default=datetime.now, comment='生效时间')
     created_at = Column(DateTime, default=datetime.now)
     description = Column(String(255), nullable=True, comment='备注说明')
+    __table_args__ = (
+        # 加速查询某时间点最近生效的比例
+        Index('idx_rate_effective_at', 'effective_at'),
+    )
 
 # 佣金记录表
 class CommissionRecord(Base):
@@ -68,11 +82,16 @@ class CommissionRecord(Base):
     is_settled = Column(Integer, default=0, comment='0-未结算，1-已结算')
     used_rate = Column(Float, comment='计算该笔佣金时使用的比例')
     link_code = Column(String(50), ForeignKey('invite_link_tree.link_code'), comment='关联邀请链接码')  # 新增外键字段
+    settlement_id = Column(Integer, ForeignKey('settlement_records.id'), nullable=True, comment='关联结算记录ID')
     __table_args__ = (
-        # 加速当日佣金统计（按created_at过滤）
-        Index('idx_created_at', 'created_at'),
-        # 加速单链接佣金统计（按link_code过滤）
-        Index('idx_link_code', 'link_code'),
+        # 加速可结算佣金查询与结算标记（覆盖amount，无需回表）
+        Index('idx_commission_inviter_settled', 'inviter_id', 'is_settled', 'amount'),
+        # 加速当日佣金统计（按created_at范围过滤，覆盖amount）
+        Index('idx_commission_created_at', 'created_at', 'amount'),
+        # 加速单链接佣金统计（按link_code过滤，覆盖is_settled与amount，总额与已结算额均无需回表）
+        Index('idx_commission_link_settled', 'link_code', 'is_settled', 'amount'),
+        # 加速按结算记录关联佣金
+        Index('idx_commission_settlement', 'settlement_id'),
     )
 
 # 用户表
@@ -89,5 +108,65 @@ class User(Base):
     
     __table_args__ = (
         Index('idx_telegram_id', 'telegram_id'),
-        Index('idx_created_at', 'created_at'),
-    )
\ No newline at end of file
+        Index('idx_user_created_at', 'created_at'),
+    )
+
+
+# 分片路由表（仅存放在目录库，即默认数据库中）：用户/邀请码 -> 所在分片
+class ShardRoute(Base):
+    __tablename__ = 'shard_routes'
+    key_type = Column(String(10), primary_key=True, comment='键类型（user/link）')
+    key = Column(String(50), primary_key=True, comment='用户ID或邀请码')
+    shard = Column(Integer, nullable=False, comment='分片序号')
+    created_at = Column(DateTime, default=datetime.now)
+
+# 邀请排行榜持久化表（仅存放在目录库）：每个时间窗口内每个用户一行，内存排行榜启动时从此加载
+class LeaderboardScore(Base):
+    __tablename__ = 'leaderboard_scores'
+    window = Column(String(10), primary_key=True, comment='时间窗口（daily/weekly/all）')
+    window_start = Column(String(10), primary_key=True, comment='窗口起始日期（all为空字符串）')
+    user_id = Column(String(50), primary_key=True, comment='邀请者ID')
+    commission = Column(Float, default=0.0, comment='窗口内佣金总额')
+    invitee_count = Column(Integer, default=0, comment='窗口内邀请人数')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# 补建缺失的列：create_all 不会为已存在的表新增列（仅支持可为空或带默认值的列）
+def ensure_columns(engine):
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    logger.warning(f'表 {table.name} 缺少非空列 {column.name}，无法自动补建，请手动迁移')
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                logger.info(f'已为表 {table.name} 补建列 {column.name}')
+
+
+# 补建缺失的索引：create_all 不会为已存在的表新增索引；索引列仍缺失时跳过并告警，
+# 同名索引的列或唯一性与模型定义不一致时删除重建
+def ensure_indexes(engine):
+    ensure_columns(engine)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        existing_indexes = {index['name']: index for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            columns = [column.name for column in index.columns]
+            missing = [name for name in columns if name not in existing]
+            if missing:
+                logger.warning(f'索引 {index.name} 的列 {", ".join(missing)} 不存在，跳过创建')
+                continue
+            current = existing_indexes.get(index.name)
+            if current is not None and (current['column_names'] != columns
+                                        or bool(current['unique']) != bool(index.unique)):
+                logger.warning(f'索引 {index.name} 的定义已变更，删除后重建')
+                index.drop(bind=engine)
+            index.create(bind=engine, checkfirst=True)
\ No newline at end of file
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+# 写库地址（默认SQLite，自动创建db文件在back目录下）
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./back.db')
+# 只读库地址（如只读副本）；未配置时SQLite使用WAL模式下的只读连接
+READ_DATABASE_URL = os.getenv('READ_DATABASE_URL')
+# 写连接池保持较小，避免多个写连接在SQLite写锁上互相等待
+WRITE_POOL_SIZE = int(os.getenv('WRITE_POOL_SIZE', '2'))
+WRITE_MAX_OVERFLOW = int(os.getenv('WRITE_MAX_OVERFLOW', '2'))
+READ_POOL_SIZE = int(os.getenv('READ_POOL_SIZE', '4'))
+READ_MAX_OVERFLOW = int(os.getenv('READ_MAX_OVERFLOW', '4'))
+# 同一用户写入后，在该时间窗口内（秒）的读请求走写库，保证读到自己的写入
+READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', '2'))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def _sqlite_readonly_url(url: str) -> Optional[str]:
+    # sqlite:///./back.db -> sqlite:///file:./back.db?mode=ro&uri=true；内存库无法共享只读连接
+    path = url[len('sqlite:///'):]
+    if not path or path == ':memory:':
+        return None
+    return f'sqlite:///file:{path}?mode=ro&uri=true'
+
+
+def _create_writer_engine(url: str):
+    if not _is_sqlite(url):
+        return create_engine(url, pool_size=WRITE_POOL_SIZE, max_overflow=WRITE_MAX_OVERFLOW, pool_pre_ping=True)
+    engine = create_engine(url, connect_args={'check_same_thread': False}, poolclass=QueuePool,
+                           pool_size=WRITE_POOL_SIZE, max_overflow=WRITE_MAX_OVERFLOW)
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragma(dbapi_conn, _):
+        # WAL模式下读不阻塞写、写不阻塞读
+        cursor = dbapi_conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.close()
+
+    return engine
+
+
+def _create_reader_engine(url: str):
+    if not _is_sqlite(url):
+        return create_engine(url, pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW, pool_pre_ping=True)
+    engine = create_engine(url, connect_args={'check_same_thread': False}, poolclass=QueuePool,
+                           pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW)
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragma(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        cursor.execute('PRAGMA query_only=1')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.close()
+
+    return engine
+
+
+# 为一个数据库创建读写两套引擎与会话工厂：(写引擎, 写会话工厂, 读引擎, 读会话工厂)
+def create_session_factories(url: str, read_url: Optional[str] = None):
+    writer = _create_writer_engine(url)
+    read_url = read_url or (_sqlite_readonly_url(url) if _is_sqlite(url) else None)
+    # 无法建立独立读连接时，读请求回退到写库
+    reader = _create_reader_engine(read_url) if read_url else writer
+    return (writer, sessionmaker(autocommit=False, autoflush=False, bind=writer),
+            reader, sessionmaker(autocommit=False, autoflush=False, bind=reader))
+
+
+engine, SessionLocal, read_engine, ReadSessionLocal = create_session_factories(DATABASE_URL, READ_DATABASE_URL)
+
+
+class ReadYourWritesTracker:
+    """记录用户最近一次写入时间，窗口期内该用户的读请求路由到写库"""
+
+    def __init__(self, window: float = READ_YOUR_WRITES_WINDOW, max_entries: int = 100000):
+        self.window = window
+        self.max_entries = max_entries
+        self._last_write: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def mark_write(self, *user_ids: str):
+        if self.window <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                if user_id:
+                    self._last_write[str(user_id)] = now
+            if len(self._last_write) > self.max_entries:
+                self._prune(now)
+
+    def requires_writer(self, user_id: Optional[str]) -> bool:
+        if not user_id or self.window <= 0:
+            return False
+        with self._lock:
+            last = self._last_write.get(str(user_id))
+            if last is None:
+                return False
+            if time.monotonic() - last > self.window:
+                del self._last_write[str(user_id)]
+                return False
+            return True
+
+    def _prune(self, now: float):
+        expired = [uid for uid, ts in self._last_write.items() if now - ts > self.window]
+        for uid in expired:
+            del self._last_write[uid]
+
+
+read_your_writes = ReadYourWritesTracker()
+
+
+# 依赖函数：写库会话（所有变更操作使用）
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# 依赖函数：读库会话（查询接口使用）；请求携带的user_id刚写入过时回退到写库
+def get_read_db(request: Request):
+    user_id = request.query_params.get('user_id')
+    db = SessionLocal() if read_your_writes.requires_writer(user_id) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,170 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from fastapi import Request
+
+from sqlalchemy import or_
+
+from .models import Base, InviteLinkTree, ShardRoute, ensure_indexes
+from .session import (engine, SessionLocal, read_engine, ReadSessionLocal,
+                      create_session_factories, read_your_writes)
+
+# 额外的分片数据库地址（逗号分隔）。默认数据库固定为0号分片，同时作为存放路由表的目录库；
+# 未配置时只有一个分片，行为与单库一致
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv('SHARD_DATABASE_URLS', '').split(',') if url.strip()]
+
+USER = 'user'
+LINK = 'link'
+
+
+class Shard:
+    def __init__(self, index: int, engine, session_factory, read_engine, read_session_factory):
+        self.index = index
+        self.engine = engine
+        self.SessionLocal = session_factory
+        self.read_engine = read_engine
+        self.ReadSessionLocal = read_session_factory
+
+
+class ShardRouter:
+    """按邀请树根节点分片：同一棵树的所有用户与邀请码都路由到同一个分片
+
+    新的根节点按用户ID哈希选择分片，之后通过路由表查找，因此增加分片不会迁移已有的邀请树；
+    路由表中不存在的键（单分片时期写入的数据）属于0号分片，新建根节点前会先在0号分片上确认并补写路由。
+    """
+
+    def __init__(self, shards: List[Shard], directory_session_factory, cache_size: int = 200000):
+        self.shards = shards
+        self.directory_session_factory = directory_session_factory
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[tuple, int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(len(shards), 1), thread_name_prefix='shard')
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.shards)
+
+    def home_shard(self, key: str) -> int:
+        # 新根节点的默认分片（稳定哈希）
+        return zlib.crc32(str(key).encode()) % self.shard_count
+
+    def lookup(self, key_type: str, key: str) -> Optional[int]:
+        # 单分片时无需查询路由表
+        if self.shard_count == 1:
+            return 0
+        cache_key = (key_type, str(key))
+        with self._lock:
+            shard = self._cache.get(cache_key)
+            if shard is not None:
+                self._cache.move_to_end(cache_key)
+                return shard
+        db = self.directory_session_factory()
+        try:
+            route = db.query(ShardRoute.shard).filter(ShardRoute.key_type == key_type,
+                                                      ShardRoute.key == str(key)).first()
+        finally:
+            db.close()
+        if route is None:
+            return None
+        self._remember(cache_key, route.shard)
+        return route.shard
+
+    def _remember(self, cache_key: tuple, shard: int):
+        with self._lock:
+            self._cache[cache_key] = shard
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def is_legacy_user(self, user_id: str) -> bool:
+        # 单分片时期写入的用户没有路由记录，其邀请树节点只存在于0号分片
+        db = self.directory_session_factory()
+        try:
+            return db.query(InviteLinkTree.id).filter(or_(InviteLinkTree.invitee_id == str(user_id),
+                                                          InviteLinkTree.inviter_id == str(user_id))).first() is not None
+        finally:
+            db.close()
+
+    def resolve(self, key_type: str, key: str, new_root: bool = False) -> Shard:
+        # 已路由的键返回其分片；未路由时，新根节点使用哈希分片，其余归0号分片
+        shard = self.lookup(key_type, key) if key else None
+        if shard is None:
+            shard = 0
+            if new_root and key:
+                if key_type == USER and self.is_legacy_user(key):
+                    # 补写路由，后续直接命中路由表
+                    self.assign(key_type, key, 0)
+                else:
+                    shard = self.home_shard(key)
+        return self.shards[shard]
+
+    def assign(self, key_type: str, key: str, shard: int):
+        if self.shard_count == 1:
+            return
+        db = self.directory_session_factory()
+        try:
+            db.merge(ShardRoute(key_type=key_type, key=str(key), shard=shard))
+            db.commit()
+        finally:
+            db.close()
+        self._remember((key_type, str(key)), shard)
+
+    # 撤销路由：先写路由再提交数据时，数据提交失败后调用，避免留下指向空分片的路由
+    def unassign(self, key_type: str, key: str):
+        if self.shard_count == 1:
+            return
+        db = self.directory_session_factory()
+        try:
+            db.query(ShardRoute).filter(ShardRoute.key_type == key_type, ShardRoute.key == str(key)) \
+              .delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._cache.pop((key_type, str(key)), None)
+
+    def session(self, shard: int, read: bool = False):
+        target = self.shards[shard]
+        return target.ReadSessionLocal() if read else target.SessionLocal()
+
+    def scatter(self, fn: Callable[[Shard], object]) -> list:
+        # 并行在所有分片上执行fn，按分片序号返回结果
+        if self.shard_count == 1:
+            return [fn(self.shards[0])]
+        return list(self._executor.map(fn, self.shards))
+
+    def create_all(self):
+        for shard in self.shards:
+            Base.metadata.create_all(bind=shard.engine)
+            ensure_indexes(shard.engine)
+
+
+def _build_shards() -> List[Shard]:
+    shards = [Shard(0, engine, SessionLocal, read_engine, ReadSessionLocal)]
+    for index, url in enumerate(SHARD_DATABASE_URLS, start=1):
+        shards.append(Shard(index, *create_session_factories(url)))
+    return shards
+
+
+shard_router = ShardRouter(_build_shards(), SessionLocal)
+
+
+# 依赖函数工厂：按请求参数（查询参数或路径参数）中的用户ID/邀请码路由到对应分片的会话
+# 会话的 info['shard'] 记录分片序号，供接口写入路由表时使用
+def shard_session(key_param: str, key_type: str = USER, read: bool = False, new_root: bool = False):
+    def dependency(request: Request):
+        key = request.query_params.get(key_param) or request.path_params.get(key_param)
+        shard = shard_router.resolve(key_type, key, new_root)
+        use_writer = not read or (key_type == USER and read_your_writes.requires_writer(key))
+        db = shard.SessionLocal() if use_writer else shard.ReadSessionLocal()
+        db.info['shard'] = shard.index
+        try:
+            yield db
+        finally:
+            db.close()
+    return dependency
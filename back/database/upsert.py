@@ -0,0 +1,13 @@
+from typing import Iterable
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# 按方言构造批量upsert语句（INSERT ... ON CONFLICT DO UPDATE），冲突时用新值覆盖 update_columns
+def upsert_statement(model, dialect_name: str, index_elements: Iterable, update_columns: Iterable[str]):
+    insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    stmt = insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_={name: stmt.excluded[name] for name in update_columns}
+    )
\ No newline at end of file
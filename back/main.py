@@ -1,64 +1,97 @@
 from fastapi import FastAPI
 from sqlalchemy.orm import Session  # 新增：导入 Session
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database.models import Base, CommissionConfig, InviteLinkTree, CommissionRecord
+from .database.models import CommissionConfig, InviteLinkTree, CommissionRecord, CommissionRateHistory, SettlementRecord
+from .database.session import get_db, get_read_db, read_your_writes
+from .database.sharding import shard_router, shard_session, USER, LINK
 from fastapi import Depends, HTTPException
-from utils.commission import calculate_commission
+from .utils.commission import calculate_commission
+from .services.stats_broadcaster import stats_broadcaster
+from .services.user_sync_service import user_profile_syncer
+from .services.leaderboard_service import leaderboard_service
+from .utils.admission_control import admission_controller, admit
+from .schemas.commission import PageResponse, CommissionSettleResponse
+from .api.commission import link_router
+from .api.leaderboard import leaderboard_router
+from contextlib import asynccontextmanager
 from sqlalchemy import func
 from datetime import datetime
 from fastapi import Request, status
 from fastapi.responses import JSONResponse
+import asyncio
 import logging
 import traceback
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动：从持久化表恢复内存排行榜，并与明细数据核对
+    await asyncio.to_thread(leaderboard_service.load)
+    # 写接口在线程池中执行，无法自行启动后台任务，在此启动排行榜定期持久化
+    leaderboard_service.start()
+    admission_controller.ensure_thread_capacity()
+    yield
+    # 退出前写入尚未同步的用户资料与排行榜
+    await user_profile_syncer.stop()
+    await leaderboard_service.stop()
 
-# 配置SQLite数据库（自动创建db文件在back目录下）
-DATABASE_URL = 'sqlite:///./back.db'
-engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+app = FastAPI(lifespan=lifespan)
 
-# 创建所有表（首次运行时执行）
-Base.metadata.create_all(bind=engine)
+# 数据库连接（读写分离）配置见 database/session.py，分片路由见 database/sharding.py
+# 访问数据库的接口均为同步函数，由FastAPI放入线程池执行：等待SQLite写锁时不会阻塞事件循环，
+# 准入控制的排队超时与快速拒绝（503）仍能及时生效
+# 创建所有表（首次运行时执行）；佣金配置与比例历史只在目录库（0号分片）中维护
+shard_router.create_all()
+
+# 邀请链接统计接口（含SSE推送）；/commission/settle 由本文件定义，不挂载 api 中的重复路由
+app.include_router(link_router)
+app.include_router(leaderboard_router)
 
 # 示例路由：获取佣金配置
 @app.get('/commission/config/{key}')
-async def get_commission_config(key: str, db: Depends[get_db]):
-    db = SessionLocal()
+def get_commission_config(key: str, db: Session = Depends(get_read_db)):
     config = db.query(CommissionConfig).filter(CommissionConfig.key == key).first()
-    db.close()
     return {'key': config.key, 'value': config.value} if config else {'error': '配置不存在'}
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 import uuid
 
 @app.post('/invite/generate')
-async def generate_invite_link(inviter_id: str, db: Session = Depends(get_db)):
+def generate_invite_link(inviter_id: str, db: Session = Depends(shard_session('inviter_id', new_root=True))):
     # 生成唯一邀请码（简化示例，实际可使用更短的哈希）
     link_code = str(uuid.uuid4())[:8]
     # 检查邀请者是否已存在（可选）
     existing_inviter = db.query(InviteLinkTree).filter(InviteLinkTree.inviter_id == inviter_id).first()
     if not existing_inviter:
+        # 已通过邀请注册的用户已有树节点（invitee_id 唯一），不能再作为根节点
+        if db.query(InviteLinkTree.id).filter(InviteLinkTree.invitee_id == inviter_id).first():
+            raise HTTPException(status_code=400, detail='用户已加入邀请树，无法创建新的根链接')
         # 根节点（无父节点）
         new_node = InviteLinkTree(inviter_id=inviter_id, invitee_id=inviter_id, link_code=link_code, parent_id=None)
+        # 新根节点：先记录整棵邀请树所在分片（写入幂等），避免树节点提交后路由写入失败导致数据不可达
+        shard_router.assign(USER, inviter_id, db.info['shard'])
+        shard_router.assign(LINK, link_code, db.info['shard'])
         db.add(new_node)
-        db.commit()
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            shard_router.unassign(USER, inviter_id)
+            shard_router.unassign(LINK, link_code)
+            raise
+        read_your_writes.mark_write(inviter_id)
+        stats_broadcaster.record_link_created()
     return {'link_code': link_code, 'url': f'https://your-domain.com/register?code={link_code}'}
 
 @app.post('/register')
-async def user_register(invitee_id: str, link_code: str, db: Session = Depends(get_db)):
+def user_register(invitee_id: str, link_code: str, db: Session = Depends(shard_session('link_code', LINK))):
     # 查找邀请码对应的邀请者
     inviter_node = db.query(InviteLinkTree).filter(InviteLinkTree.link_code == link_code).first()
     if not inviter_node:
         raise HTTPException(status_code=400, detail='无效的邀请码')
-    # 检查被邀请者是否已存在
+    # 检查被邀请者是否已存在（先查路由表，覆盖其他分片上的邀请树；无路由的历史用户在0号分片上）
+    routed = shard_router.lookup(USER, invitee_id)
+    if routed is None and db.info['shard'] != 0 and shard_router.is_legacy_user(invitee_id):
+        routed = 0
+    if routed not in (None, db.info['shard']):
+        raise HTTPException(status_code=400, detail='用户已注册')
     existing_invitee = db.query(InviteLinkTree).filter(InviteLinkTree.invitee_id == invitee_id).first()
     if existing_invitee:
         raise HTTPException(status_code=400, detail='用户已注册')
@@ -69,19 +102,53 @@ async def user_register(invitee_id: str, link_code: str, db: Session = Depends(g
         link_code=link_code,
         parent_id=inviter_node.id
     )
+    # 被邀请者与邀请者属于同一棵树，先写路由再提交树节点
+    shard_router.assign(USER, invitee_id, db.info['shard'])
     db.add(new_node)
-    db.commit()
+    try:
+        db.commit()
+    except Exception:
+        # 提交失败时撤销路由，否则该用户在其他分片上会被误判为已注册
+        db.rollback()
+        shard_router.unassign(USER, invitee_id)
+        raise
+    read_your_writes.mark_write(invitee_id, inviter_node.inviter_id)
+    leaderboard_service.record_invitee(inviter_node.inviter_id)
     return {'message': '注册成功，邀请关系已记录'}
 
 
+# Telegram用户资料更新：仅入队，由后台批量upsert到users表
+@app.post('/user/profile', status_code=status.HTTP_202_ACCEPTED)
+async def sync_user_profile(
+    telegram_id: str,
+    username: str = None,
+    first_name: str = None,
+    last_name: str = None,
+    is_active: bool = None
+):
+    user_profile_syncer.submit(
+        telegram_id,
+        username=username,
+        first_name=first_name,
+        last_name=last_name,
+        is_active=is_active
+    )
+    return {'message': '已加入同步队列', 'telegram_id': telegram_id}
+
+
 @app.post('/order/complete')
-async def complete_order(invitee_id: str, order_amount: float, db: Session = Depends(get_db)):
-    records = calculate_commission(db, invitee_id, order_amount)
+def complete_order(invitee_id: str, order_amount: float, db: Session = Depends(shard_session('invitee_id'))):
+    records = calculate_commission(db, invitee_id, order_amount, datetime.now())
+    read_your_writes.mark_write(*(r.inviter_id for r in records))
+    if records:
+        stats_broadcaster.record_commission(sum(r.amount for r in records))
+    for r in records:
+        leaderboard_service.record_commission(r.inviter_id, r.amount)
     return {'message': '佣金已结算', 'records': [{'inviter_id': r.inviter_id, 'amount': r.amount} for r in records]}
 
 
 @app.get('/commission/available')
-async def get_available_commission(user_id: str, db: Session = Depends(get_db)):
+def get_available_commission(user_id: str, db: Session = Depends(shard_session('user_id', read=True))):
     # 查询所有该用户作为邀请者、未结算的佣金
     available = db.query(func.sum(CommissionRecord.amount))\
                    .filter(CommissionRecord.inviter_id == user_id)\
@@ -90,7 +157,7 @@ async def get_available_commission(user_id: str, db: Session = Depends(get_db)):
     return {'user_id': user_id, 'available_amount': available or 0.0}
 
 @app.post('/commission/settle')
-async def settle_commission(user_id: str, db: Session = Depends(get_db)):
+def settle_commission(user_id: str, db: Session = Depends(shard_session('user_id'))):
     # 1. 查询可结算的佣金总额
     available_amount = db.query(func.sum(CommissionRecord.amount))\
                          .filter(CommissionRecord.inviter_id == user_id)\
@@ -110,16 +177,18 @@ async def settle_commission(user_id: str, db: Session = Depends(get_db)):
         db.add(settlement)
         db.flush()  # 获取刚插入的settlement.id
 
-        # 4. 标记关联的佣金为已结算
+        # 4. 标记关联的佣金为已结算，并关联本次结算记录
         db.query(CommissionRecord)\
           .filter(CommissionRecord.inviter_id == user_id)\
           .filter(CommissionRecord.is_settled == 0)\
-          .update({CommissionRecord.is_settled: 1})
+          .update({CommissionRecord.is_settled: 1, CommissionRecord.settlement_id: settlement.id})
 
         # 5. 模拟结算完成（实际可对接支付系统，这里简化为直接标记完成）
         settlement.status = 'completed'
         settlement.completed_at = datetime.now()
         db.commit()
+        read_your_writes.mark_write(user_id)
+        stats_broadcaster.record_settlement(available_amount)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f'结算失败：{str(e)}')
@@ -127,22 +196,22 @@ async def settle_commission(user_id: str, db: Session = Depends(get_db)):
     return {'message': '结算成功', 'settlement_id': settlement.id, 'amount': available_amount}
 
 @app.get('/commission/settlement/history', response_model=PageResponse[CommissionSettleResponse])
-async def get_settlement_history(
+def get_settlement_history(
     user_id: str,
     page: int = 1,
     page_size: int = 10,
-    db: Session = Depends(get_db)
+    db: Session = Depends(shard_session('user_id', read=True))
 ):
     # 计算总条数
-    total = db.query(SettlementRecord)
-              .filter(SettlementRecord.user_id == user_id)
+    total = db.query(SettlementRecord) \
+              .filter(SettlementRecord.user_id == user_id) \
               .count()
     # 分页查询
-    records = db.query(SettlementRecord)
-                .filter(SettlementRecord.user_id == user_id)
-                .order_by(SettlementRecord.created_at.desc())
-                .offset((page - 1) * page_size)
-                .limit(page_size)
+    records = db.query(SettlementRecord) \
+                .filter(SettlementRecord.user_id == user_id) \
+                .order_by(SettlementRecord.created_at.desc()) \
+                .offset((page - 1) * page_size) \
+                .limit(page_size) \
                 .all()
     # 转换响应数据
     formatted_records = [{
@@ -162,7 +231,7 @@ async def get_settlement_history(
 
 
 @app.post('/admin/commission/rate')
-async def set_commission_rate(
+def set_commission_rate(
     admin_id: str,
     rate: float,
     description: str = '',
@@ -182,19 +251,19 @@ async def set_commission_rate(
 
 
 @app.get('/admin/commission/rate/history')
-async def get_commission_rate_history(
+def get_commission_rate_history(
     admin_id: str = None,
     page: int = 1,
     page_size: int = 10,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     query = db.query(CommissionRateHistory)
     if admin_id:
         query = query.filter(CommissionRateHistory.admin_id == admin_id)
     # 按生效时间倒序排序
-    records = query.order_by(CommissionRateHistory.effective_at.desc())
-                  .offset((page - 1) * page_size)
-                  .limit(page_size)
+    records = query.order_by(CommissionRateHistory.effective_at.desc()) \
+                  .offset((page - 1) * page_size) \
+                  .limit(page_size) \
                   .all()
     return [{
         'id': r.id,
@@ -232,3 +301,46 @@ async def global_exception_handler(request: Request, call_next):
                 'timestamp': datetime.now().isoformat()
             }
         )
+
+# 准入控制中间件（最后注册，位于最外层）：超出并发与排队上限时快速返回503，避免请求无限堆积
+@app.middleware('http')
+async def admission_control(request: Request, call_next):
+    limit = admission_controller.limit_for(request.method, request.url.path)
+    if limit is None:
+        return await call_next(request)
+    admitted, response = await admit(limit, call_next, request)
+    if admitted:
+        return response
+    retry_after = limit.retry_after()
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(retry_after)},
+        content={
+            'code': 503,
+            'message': '服务繁忙，请稍后重试',
+            'detail': f'{limit.name} 超出并发限制',
+            'timestamp': datetime.now().isoformat()
+        }
+    )
+
+
+@app.get('/admin/admission/stats')
+async def get_admission_stats():
+    return admission_controller.stats()
+
+
+@app.post('/admin/admission/limits')
+async def set_admission_limit(
+    name: str,
+    max_concurrency: int = None,
+    max_queue: int = None,
+    queue_timeout: float = None
+):
+    try:
+        limit = admission_controller.update(name, max_concurrency, max_queue, queue_timeout)
+    except KeyError:
+        raise HTTPException(status_code=404, detail='限流规则不存在')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    admission_controller.ensure_thread_capacity()
+    return {'name': name, **limit.stats()}
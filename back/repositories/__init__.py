@@ -1,4 +1,6 @@
+from fastapi import Depends
 from sqlalchemy.orm import Session
+from ..database.session import get_db
 from .commission_record_repository import CommissionRecordRepository
 from .settlement_record_repository import SettlementRecordRepository
 
@@ -1,39 +1,88 @@
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, case
 from sqlalchemy.orm import Session
 from ..database.models import InviteLinkTree, CommissionRecord, SettlementRecord
 from ..schemas.commission import PageRequest
 from typing import Tuple, List
-from datetime import datetime
+from datetime import datetime, timedelta
 
 class CommissionRecordRepository:
     def __init__(self, db: Session):
         self.db = db
 
+    # 当日时间范围 [今日0点, 明日0点)，用范围条件代替 func.date() 以便命中索引
+    @staticmethod
+    def _today_range() -> Tuple[datetime, datetime]:
+        start = datetime.combine(datetime.today().date(), datetime.min.time())
+        return start, start + timedelta(days=1)
+
     # 1. 总计链接创建数
     def get_total_link_count(self) -> int:
         return self.db.query(func.count(InviteLinkTree.link_code.distinct())).scalar()
 
     # 3. 当日产生的佣金金额
     def get_today_commission(self) -> float:
-        today = datetime.today().date()
+        start, end = self._today_range()
         result = self.db.query(func.round(func.sum(CommissionRecord.amount), 2)) \
-                   .filter(func.date(CommissionRecord.created_at) == today) \
+                   .filter(CommissionRecord.created_at >= start, CommissionRecord.created_at < end) \
                    .scalar()
         return float(result) if result is not None else 0.0
 
     # 4. 当日已结算的佣金金额
     def get_today_settled_commission(self) -> float:
-        today = datetime.today().date()
+        start, end = self._today_range()
         result = self.db.query(func.round(func.sum(SettlementRecord.total_amount), 2)) \
-                   .filter(func.date(SettlementRecord.completed_at) == today) \
+                   .filter(SettlementRecord.completed_at >= start, SettlementRecord.completed_at < end) \
                    .scalar()
         return float(result) if result is not None else 0.0
 
+    # 按链接汇总的查询：每个链接一行，邀请人数为共用该链接码的节点数
+    # 被邀请者节点沿用邀请者的链接码，同一 link_code 对应多个树节点，佣金先在子查询中按链接汇总再关联，
+    # 避免按节点数重复计入；指定 inviter_id 时两侧都只查该用户的数据
+    def _link_summary_query(self, inviter_id: str = None):
+        link_commission = self.db.query(
+            CommissionRecord.link_code,
+            func.sum(CommissionRecord.amount).label('total_commission'),
+            func.sum(case((CommissionRecord.is_settled == 1, CommissionRecord.amount), else_=0)).label('settled_commission')
+        )
+        if inviter_id is not None:
+            # 佣金记录的 inviter_id 即链接所有者
+            link_commission = link_commission.filter(CommissionRecord.inviter_id == inviter_id)
+        link_commission = link_commission.group_by(CommissionRecord.link_code).subquery()
+
+        created_at = func.min(InviteLinkTree.created_at).label('created_at')
+        query = self.db.query(
+            InviteLinkTree.link_code,
+            InviteLinkTree.inviter_id,
+            created_at,
+            func.count(InviteLinkTree.invitee_id).label('invitee_count'),
+            link_commission.c.total_commission,
+            link_commission.c.settled_commission
+        ).outerjoin(link_commission, InviteLinkTree.link_code == link_commission.c.link_code)
+        if inviter_id is not None:
+            query = query.filter(InviteLinkTree.inviter_id == inviter_id)
+        query = query.group_by(
+            InviteLinkTree.link_code, InviteLinkTree.inviter_id,
+            link_commission.c.total_commission, link_commission.c.settled_commission
+        )
+        return query, created_at
+
+    @staticmethod
+    def _link_summary(r) -> dict:
+        return {
+            'link_code': r.link_code,
+            'inviter_id': r.inviter_id,
+            'created_at': r.created_at,
+            'invitee_count': r.invitee_count,
+            'total_commission': r.total_commission or 0.0,
+            'settled_commission': r.settled_commission or 0.0,
+            'unsettled_commission': (r.total_commission or 0.0) - (r.settled_commission or 0.0)
+        }
+
     # 5. 个人创建的链接列表（分页）
     def get_user_links(
         self, user_id: str, page_req: PageRequest
-    ) -> Tuple[List[InviteLinkTree], int]:
-        query = self.db.query(InviteLinkTree).filter(InviteLinkTree.inviter_id == user_id)
+    ) -> Tuple[List[dict], int]:
+        query, created_at = self._link_summary_query(inviter_id=user_id)
         # 关键字过滤（假设搜索link_code）
         if page_req.keyword:
             query = query.filter(InviteLinkTree.link_code.like(f'%{page_req.keyword}%'))
@@ -43,41 +92,39 @@ class CommissionRecordRepository:
         if page_req.end_date:
             query = query.filter(InviteLinkTree.created_at <= page_req.end_date)
         total = query.count()
-        records = query.order_by(InviteLinkTree.created_at.desc()).offset((page_req.page - 1) * page_req.page_size).limit(page_req.page_size).all()
-        return records, total
+        records = query.order_by(created_at.desc()).offset((page_req.page - 1) * page_req.page_size).limit(page_req.page_size).all()
+        return [self._link_summary(r) for r in records], total
 
-    # 6. 单条链接的佣金记录
-    def get_link_commission_detail(self, link_code: str) -> dict:
+    # 6. 单条链接的佣金记录（汇总 + 最近的明细）
+    def get_link_commission_detail(self, link_code: str, record_limit: int = 100) -> dict:
         # 总佣金
         total = self.db.query(func.sum(CommissionRecord.amount)).filter(CommissionRecord.link_code == link_code).scalar() or 0.0
-        # 已结算佣金
-        settled = self.db.query(func.sum(SettlementRecord.total_amount)).join(CommissionRecord, SettlementRecord.id == CommissionRecord.settlement_id).filter(CommissionRecord.link_code == link_code).scalar() or 0.0
+        # 已结算佣金（按佣金记录自身金额统计，一笔结算关联多条佣金时不会重复计入结算总额）
+        settled = self.db.query(func.sum(CommissionRecord.amount)).filter(CommissionRecord.link_code == link_code).filter(CommissionRecord.is_settled == 1).scalar() or 0.0
+        records = self.db.query(CommissionRecord).filter(CommissionRecord.link_code == link_code) \
+                    .order_by(CommissionRecord.created_at.desc()).limit(record_limit).all()
         return {
             'link_code': link_code,
             'total_commission': total,
             'settled_commission': settled,
-            'unsettled_commission': total - settled
+            'unsettled_commission': total - settled,
+            'records': [{
+                'inviter_id': r.inviter_id,
+                'invitee_id': r.invitee_id,
+                'order_id': r.order_id,
+                'amount': r.amount,
+                'used_rate': r.used_rate,
+                'is_settled': r.is_settled,
+                'settlement_id': r.settlement_id,
+                'created_at': r.created_at
+            } for r in records]
         }
 
     # 7. 所有链接信息（分页+关键字+时间）
     def get_all_links(
         self, page_req: PageRequest
     ) -> Tuple[List[dict], int]:
-        # 子查询：统计每个链接的邀请人数
-        invitee_count = self.db.query(
-            InviteLinkTree.link_code,
-            func.count(InviteLinkTree.invitee_id).label('invitee_count')
-        ).group_by(InviteLinkTree.link_code).subquery()
-
-        # 主查询：关联佣金和结算数据
-        query = self.db.query(
-            InviteLinkTree.link_code,
-            InviteLinkTree.inviter_id,
-            InviteLinkTree.created_at,
-            invitee_count.c.invitee_count,
-            func.sum(CommissionRecord.amount).label('total_commission'),
-            func.sum(SettlementRecord.total_amount).label('settled_commission')
-        ).outerjoin(CommissionRecord, InviteLinkTree.link_code == CommissionRecord.link_code).outerjoin(SettlementRecord, CommissionRecord.settlement_id == SettlementRecord.id).join(invitee_count, InviteLinkTree.link_code == invitee_count.c.link_code).group_by(InviteLinkTree.link_code, invitee_count.c.invitee_count)
+        query, created_at = self._link_summary_query()
 
         # 关键字过滤（link_code或inviter_id）
         if page_req.keyword:
@@ -94,17 +141,9 @@ class CommissionRecordRepository:
             query = query.filter(InviteLinkTree.created_at <= page_req.end_date)
 
         total = query.count()
-        records = query.order_by(InviteLinkTree.created_at.desc()).offset((page_req.page - 1) * page_req.page_size).limit(page_req.page_size).all()
+        records = query.order_by(created_at.desc()).offset((page_req.page - 1) * page_req.page_size).limit(page_req.page_size).all()
         # 转换为字典列表
-        return [{
-            'link_code': r.link_code,
-            'inviter_id': r.inviter_id,
-            'created_at': r.created_at,
-            'invitee_count': r.invitee_count,
-            'total_commission': r.total_commission or 0.0,
-            'settled_commission': r.settled_commission or 0.0,
-            'unsettled_commission': (r.total_commission or 0.0) - (r.settled_commission or 0.0)
-        } for r in records], total
+        return [self._link_summary(r) for r in records], total
 
     def get_paginated_settlement_history(
         self, user_id: str, page: int, page_size: int
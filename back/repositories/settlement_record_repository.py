@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from database.models import SettlementRecord  # 假设存在 SettlementRecord 模型
+from ..database.models import SettlementRecord  # 假设存在 SettlementRecord 模型
 
 class SettlementRecordRepository:
     def __init__(self, db: Session):
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, constr, Field, Optional
+from pydantic import BaseModel, constr, Field
 from datetime import datetime
-from typing import Generic, TypeVar, List
+from typing import Generic, TypeVar, List, Optional
 
 # 通用分页请求（已存在，此处补充扩展）
 class PageRequest(BaseModel):
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import List
+
+# 响应模型：排行榜条目
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: str
+    score: float
+
+# 响应模型：排行榜 top-K
+class LeaderboardResponse(BaseModel):
+    metric: str  # commission（佣金总额）/ invitees（邀请人数）
+    window: str  # daily / weekly / all
+    data: List[LeaderboardEntry]
+
+# 响应模型：指定用户的排名
+class LeaderboardRankResponse(BaseModel):
+    metric: str
+    window: str
+    rank: int
+    user_id: str
+    score: float
+    total: int  # 榜单总人数
\ No newline at end of file
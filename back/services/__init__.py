@@ -1,7 +1,9 @@
 from fastapi import Depends
+from sqlalchemy.orm import Session
+from ..database.session import get_db
 from .commission_service import CommissionService
-from ..repositories import (get_commission_record_repo,
-                             get_settlement_record_repo)
+from ..repositories import (CommissionRecordRepository, SettlementRecordRepository,
+                             get_commission_record_repo, get_settlement_record_repo)
 
 # 依赖函数：生成CommissionService实例
 async def get_commission_service(
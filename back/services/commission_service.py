@@ -41,12 +41,12 @@ class CommissionService:
     def get_user_links(self, user_id: str, page_req: PageRequest) -> PageResponse[UserLinkResponse]:
         records, total = self.commission_repo.get_user_links(user_id, page_req)
         formatted = [UserLinkResponse(
-            link_code=str(r.link_code),
-            created_at=r.created_at,
-            invitee_count=r.invitee_count,
-            total_commission=r.total_commission,
-            settled_commission=r.settled_commission,
-            unsettled_commission=r.unsettled_commission
+            link_code=str(r['link_code']),
+            created_at=r['created_at'],
+            invitee_count=r['invitee_count'],
+            total_commission=r['total_commission'],
+            settled_commission=r['settled_commission'],
+            unsettled_commission=r['unsettled_commission']
         ) for r in records]
         return PageResponse(
             data=formatted,
@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from ..database.models import CommissionRecord, InviteLinkTree, LeaderboardScore
+from ..database.session import SessionLocal
+from ..database.sharding import ShardRouter, shard_router
+from ..database.upsert import upsert_statement
+
+logger = logging.getLogger(__name__)
+
+COMMISSION = 'commission'
+INVITEES = 'invitees'
+METRICS = (COMMISSION, INVITEES)
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+ALL_TIME = 'all'
+WINDOWS = (DAILY, WEEKLY, ALL_TIME)
+
+
+def window_start(window: str, now: datetime) -> str:
+    if window == DAILY:
+        return now.date().isoformat()
+    if window == WEEKLY:
+        return (now.date() - timedelta(days=now.weekday())).isoformat()
+    return ''
+
+
+class SortedScores:
+    """按分数倒序维护的有序列表：二分定位 O(log n)，但列表的插入/删除需要移动元素，单次更新为 O(n)
+
+    n 为窗口内上榜用户数；移动是连续内存拷贝，在该规模下开销很小。top-K 为 O(k)，排名查询为 O(log n)。
+    """
+
+    def __init__(self):
+        self.scores: Dict[str, float] = {}
+        self._ordered: List[Tuple[float, str]] = []  # (-score, user_id)，分数相同按用户ID排序
+
+    def __len__(self) -> int:
+        return len(self._ordered)
+
+    def add(self, user_id: str, delta: float) -> float:
+        old = self.scores.get(user_id)
+        if old is not None:
+            del self._ordered[bisect_left(self._ordered, (-old, user_id))]
+        score = (old or 0) + delta
+        self.scores[user_id] = score
+        insort(self._ordered, (-score, user_id))
+        return score
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        return [(user_id, -neg) for neg, user_id in self._ordered[:k]]
+
+    def rank(self, user_id: str) -> Optional[int]:
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self._ordered, (-score, user_id)) + 1
+
+
+class LeaderboardWindow:
+    def __init__(self, window: str, start: str):
+        self.window = window
+        self.start = start
+        self.boards = {metric: SortedScores() for metric in METRICS}
+
+
+class LeaderboardService:
+    """邀请排行榜：由佣金写入与注册增量更新内存有序结构，定期持久化到 leaderboard_scores
+
+    时间窗口切换时直接换一个空窗口，旧窗口的持久化数据在下次刷新时清理。
+    """
+
+    def __init__(self, session_factory=SessionLocal, router: ShardRouter = shard_router,
+                 flush_interval: float = 5.0):
+        self.session_factory = session_factory
+        self.router = router
+        self.flush_interval = flush_interval
+        self._windows: Dict[str, LeaderboardWindow] = {}
+        self._dirty: Set[Tuple[str, str]] = set()  # (window, user_id)
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _current(self, window: str, now: datetime = None) -> LeaderboardWindow:
+        start = window_start(window, now or datetime.now())
+        current = self._windows.get(window)
+        if current is None or current.start != start:
+            # 窗口滚动：旧窗口整体丢弃，无需逐条扣减
+            current = LeaderboardWindow(window, start)
+            self._windows[window] = current
+            self._dirty = {(w, u) for w, u in self._dirty if w != window}
+        return current
+
+    def _record(self, metric: str, user_id: str, delta: float, at: datetime = None):
+        now = datetime.now()
+        with self._lock:
+            for window in WINDOWS:
+                current = self._current(window, now)
+                # 补记的历史数据只计入其所属的窗口
+                if at is not None and window_start(window, at) != current.start:
+                    continue
+                current.boards[metric].add(str(user_id), delta)
+                self._dirty.add((window, str(user_id)))
+        self._ensure_started()
+
+    # 写入方调用：新增佣金记录后
+    def record_commission(self, inviter_id: str, amount: float, at: datetime = None):
+        self._record(COMMISSION, inviter_id, amount, at)
+
+    # 写入方调用：新用户通过邀请链接注册后
+    def record_invitee(self, inviter_id: str, at: datetime = None):
+        self._record(INVITEES, inviter_id, 1, at)
+
+    def top(self, metric: str, window: str, k: int = 10) -> List[dict]:
+        with self._lock:
+            entries = self._current(window).boards[metric].top(k)
+        return [{'rank': i + 1, 'user_id': user_id, 'score': score} for i, (user_id, score) in enumerate(entries)]
+
+    def rank(self, user_id: str, metric: str, window: str) -> Optional[dict]:
+        with self._lock:
+            board = self._current(window).boards[metric]
+            rank = board.rank(str(user_id))
+            if rank is None:
+                return None
+            return {'rank': rank, 'user_id': str(user_id), 'score': board.scores[str(user_id)], 'total': len(board)}
+
+    def load(self):
+        # 启动时从持久化表恢复当前窗口；表为空或全量榜与明细数据不一致时从明细数据重建
+        now = datetime.now()
+        db = self.session_factory()
+        try:
+            starts = {window: window_start(window, now) for window in WINDOWS}
+            rows = db.query(LeaderboardScore).filter(or_(*(
+                and_(LeaderboardScore.window == window, LeaderboardScore.window_start == start)
+                for window, start in starts.items()
+            ))).all()
+        finally:
+            db.close()
+        with self._lock:
+            self._windows = {window: LeaderboardWindow(window, start) for window, start in starts.items()}
+            self._dirty.clear()
+            loaded = False
+            for row in rows:
+                current = self._windows[row.window]
+                loaded = True
+                if row.commission:
+                    current.boards[COMMISSION].add(row.user_id, row.commission)
+                if row.invitee_count:
+                    current.boards[INVITEES].add(row.user_id, row.invitee_count)
+        if not loaded:
+            self.rebuild()
+        elif not self.reconcile():
+            logger.warning('排行榜持久化数据与明细数据不一致，已从明细数据重建')
+
+    def _totals(self) -> Tuple[float, int]:
+        # 各分片明细数据的全量汇总：佣金总额与邀请总人数（根节点不计为邀请）
+        def _collect(shard):
+            db = shard.ReadSessionLocal()
+            try:
+                commission = db.query(func.sum(CommissionRecord.amount)).scalar() or 0.0
+                invitees = db.query(func.count(InviteLinkTree.id)).filter(InviteLinkTree.parent_id.isnot(None)).scalar()
+                return commission, invitees
+            finally:
+                db.close()
+
+        results = self.router.scatter(_collect)
+        return sum(c for c, _ in results), sum(n for _, n in results)
+
+    def reconcile(self) -> bool:
+        # 比对内存全量榜的合计与明细数据汇总，不一致时重建；返回是否一致
+        # （未刷新即退出、刷新失败等都会让持久化数据落后于明细数据）
+        commission, invitees = self._totals()
+        with self._lock:
+            boards = self._current(ALL_TIME).boards
+            board_commission = sum(boards[COMMISSION].scores.values())
+            board_invitees = sum(boards[INVITEES].scores.values())
+        if abs(board_commission - commission) < 0.01 and int(board_invitees) == invitees:
+            return True
+        self.rebuild()
+        return False
+
+    def rebuild(self):
+        # 从各分片的佣金记录与邀请树汇总重建所有窗口（持久化数据缺失或与明细不一致时使用）
+        now = datetime.now()
+        windows = {window: LeaderboardWindow(window, window_start(window, now)) for window in WINDOWS}
+        since = {window: (datetime.fromisoformat(w.start) if w.start else None) for window, w in windows.items()}
+
+        def _collect(shard):
+            db = shard.ReadSessionLocal()
+            try:
+                result = {}
+                for window in WINDOWS:
+                    commissions = db.query(CommissionRecord.inviter_id, func.sum(CommissionRecord.amount))
+                    # 根节点的 invitee_id 等于 inviter_id，不计为邀请
+                    invitees = db.query(InviteLinkTree.inviter_id, func.count(InviteLinkTree.id)) \
+                                 .filter(InviteLinkTree.parent_id.isnot(None))
+                    if since[window] is not None:
+                        commissions = commissions.filter(CommissionRecord.created_at >= since[window])
+                        invitees = invitees.filter(InviteLinkTree.created_at >= since[window])
+                    result[window] = (commissions.group_by(CommissionRecord.inviter_id).all(),
+                                      invitees.group_by(InviteLinkTree.inviter_id).all())
+                return result
+            finally:
+                db.close()
+
+        for result in self.router.scatter(_collect):
+            for window, (commissions, invitees) in result.items():
+                for user_id, amount in commissions:
+                    windows[window].boards[COMMISSION].add(user_id, amount or 0.0)
+                for user_id, count in invitees:
+                    windows[window].boards[INVITEES].add(user_id, count)
+        with self._lock:
+            self._windows = windows
+            self._dirty = {(window, user_id) for window, w in windows.items()
+                           for board in w.boards.values() for user_id in board.scores}
+        self.flush()
+
+    def flush(self) -> int:
+        now = datetime.now()
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            rows = []
+            for window, user_id in dirty:
+                current = self._current(window, now)
+                rows.append({
+                    'window': window,
+                    'window_start': current.start,
+                    'user_id': user_id,
+                    'commission': current.boards[COMMISSION].scores.get(user_id, 0.0),
+                    'invitee_count': int(current.boards[INVITEES].scores.get(user_id, 0)),
+                    'updated_at': now,
+                })
+            starts = {window: w.start for window, w in self._windows.items()}
+        db = self.session_factory()
+        try:
+            if rows:
+                db.execute(upsert_statement(
+                    LeaderboardScore, db.get_bind().dialect.name,
+                    [LeaderboardScore.window, LeaderboardScore.window_start, LeaderboardScore.user_id],
+                    ('commission', 'invitee_count', 'updated_at')
+                ), rows)
+            # 清理已滚出的窗口
+            for window, start in starts.items():
+                db.query(LeaderboardScore).filter(LeaderboardScore.window == window,
+                                                  LeaderboardScore.window_start != start) \
+                  .delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        finally:
+            db.close()
+        return len(rows)
+
+    def start(self):
+        # 在事件循环中调用：写入方可能运行在线程池中，此时 _record 无法启动持久化任务
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self._dirty:
+                continue
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f'排行榜持久化失败：{e}')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+
+leaderboard_service = LeaderboardService()
@@ -0,0 +1,89 @@
+import heapq
+from itertools import islice
+from math import ceil
+
+from ..database.session import read_your_writes
+from ..database.sharding import ShardRouter, shard_router, USER, LINK
+from ..repositories import CommissionRecordRepository, SettlementRecordRepository
+from ..schemas.commission import (PageRequest, LinkStatsResponse, UserLinkResponse, LinkCommissionDetail,
+                                  AllLinkInfoResponse, PageResponse)
+from .commission_service import CommissionService
+
+
+class ShardedCommissionService:
+    """分片版佣金服务：单用户/单链接的请求转发到所属分片，全局视图在所有分片上并行查询后合并"""
+
+    def __init__(self, router: ShardRouter = shard_router):
+        self.router = router
+
+    def _run_on_shard(self, shard: int, fn, read: bool = True):
+        db = self.router.session(shard, read=read)
+        try:
+            service = CommissionService(db, CommissionRecordRepository(db), SettlementRecordRepository(db))
+            return fn(service)
+        finally:
+            db.close()
+
+    def settle_commission(self, user_id: str):
+        def _settle(service: CommissionService):
+            result = service.settle_commission(user_id)
+            service.db.commit()
+            return result
+        return self._run_on_shard(self.router.resolve(USER, user_id).index, _settle, read=False)
+
+    # 1-4 统计接口：各分片分别统计后求和
+    def get_link_stats(self) -> LinkStatsResponse:
+        def _collect(shard):
+            db = shard.ReadSessionLocal()
+            try:
+                repo = CommissionRecordRepository(db)
+                return repo.get_total_link_count(), repo.get_today_commission(), repo.get_today_settled_commission()
+            finally:
+                db.close()
+        results = self.router.scatter(_collect)
+        return LinkStatsResponse(
+            total_created=sum(r[0] for r in results),
+            today_clicks=0,
+            today_commission=round(sum(r[1] for r in results), 2),
+            today_settled=round(sum(r[2] for r in results), 2)
+        )
+
+    # 5. 个人创建的链接列表（用户所属分片）
+    def get_user_links(self, user_id: str, page_req: PageRequest) -> PageResponse[UserLinkResponse]:
+        shard = self.router.resolve(USER, user_id).index
+        read = not read_your_writes.requires_writer(user_id)
+        return self._run_on_shard(shard, lambda service: service.get_user_links(user_id, page_req), read=read)
+
+    # 6. 单条链接佣金详情（链接所属分片）
+    def get_link_commission_detail(self, link_code: str) -> LinkCommissionDetail:
+        shard = self.router.resolve(LINK, link_code).index
+        return self._run_on_shard(shard, lambda service: service.get_link_commission_detail(link_code))
+
+    # 7. 所有链接信息（分页）：每个分片取前 page*page_size 条，按创建时间倒序归并后截取当前页
+    def get_all_links(self, page_req: PageRequest) -> PageResponse[AllLinkInfoResponse]:
+        window = PageRequest(
+            page=1,
+            page_size=page_req.page * page_req.page_size,
+            keyword=page_req.keyword,
+            start_date=page_req.start_date,
+            end_date=page_req.end_date
+        )
+
+        def _collect(shard):
+            db = shard.ReadSessionLocal()
+            try:
+                return CommissionRecordRepository(db).get_all_links(window)
+            finally:
+                db.close()
+        results = self.router.scatter(_collect)
+        merged = heapq.merge(*(records for records, _ in results), key=lambda r: r['created_at'], reverse=True)
+        offset = (page_req.page - 1) * page_req.page_size
+        page = list(islice(merged, offset, offset + page_req.page_size))
+        total = sum(total for _, total in results)
+        return PageResponse(
+            data=[AllLinkInfoResponse(**r) for r in page],
+            total=total,
+            page=page_req.page,
+            page_size=page_req.page_size,
+            total_pages=ceil(total / page_req.page_size)
+        )
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import threading
+from datetime import date
+from typing import AsyncIterator, Optional, Set
+
+from .sharded_commission_service import ShardedCommissionService
+
+logger = logging.getLogger(__name__)
+
+
+class StatsBroadcaster:
+    """单一发布者：汇总佣金/结算写入产生的统计增量，合并后推送给所有订阅者
+
+    每个订阅者只有一个容量为1的队列，新快照覆盖未消费的旧快照，
+    因此慢客户端只会错过中间状态，不会阻塞发布者。最后一个订阅者断开后发布者退出，
+    下一个订阅者到来时重新启动并全量重算。
+    """
+
+    def __init__(self, min_interval: float = 0.5, resync_interval: float = 30.0):
+        self.min_interval = min_interval          # 两次推送的最小间隔（秒），期间的增量合并为一次
+        self.resync_interval = resync_interval    # 全量重算间隔（秒），修正增量误差并处理跨天
+        self._snapshot: Optional[dict] = None
+        self._snapshot_date: Optional[date] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._lock = threading.Lock()
+        self._pending_commission = 0.0
+        self._pending_settled = 0.0
+        self._pending_links = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    # 写入方调用：记录增量并唤醒发布者（可在任意线程调用）
+    def record_commission(self, amount: float):
+        with self._lock:
+            self._pending_commission += amount
+        self._notify()
+
+    def record_settlement(self, amount: float):
+        with self._lock:
+            self._pending_settled += amount
+        self._notify()
+
+    def record_link_created(self, count: int = 1):
+        with self._lock:
+            self._pending_links += count
+        self._notify()
+
+    def _notify(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def subscribe(self, heartbeat: float = 15.0) -> AsyncIterator[Optional[dict]]:
+        # 依次产出统计快照；超过heartbeat秒无更新时产出None，供调用方发送心跳
+        self._ensure_started()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        if self._snapshot is not None:
+            queue.put_nowait(self._snapshot)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscribers.discard(queue)
+
+    def _publish(self, snapshot: dict):
+        self._snapshot = snapshot
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+
+    def _take_pending(self):
+        with self._lock:
+            pending = (self._pending_commission, self._pending_settled, self._pending_links)
+            self._pending_commission = self._pending_settled = 0.0
+            self._pending_links = 0
+        return pending
+
+    @staticmethod
+    def _compute_snapshot() -> dict:
+        return dict(ShardedCommissionService().get_link_stats())
+
+    async def _resync(self):
+        # 先清空增量再重算：重算期间到达的增量可能被重复计入，由下一次重算修正
+        self._take_pending()
+        snapshot = await asyncio.to_thread(self._compute_snapshot)
+        self._snapshot_date = date.today()
+        self._publish(snapshot)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_resync = None
+        while self._subscribers:
+            if last_resync is None or date.today() != self._snapshot_date \
+                    or loop.time() - last_resync >= self.resync_interval:
+                try:
+                    await self._resync()
+                    last_resync = loop.time()
+                except Exception as e:
+                    # 重算失败时保留旧快照，下一轮再试
+                    logger.error(f'统计快照重算失败：{e}')
+            else:
+                commission, settled, links = self._take_pending()
+                if commission or settled or links:
+                    snapshot = dict(self._snapshot)
+                    snapshot['total_created'] += links
+                    snapshot['today_commission'] = round(snapshot['today_commission'] + commission, 2)
+                    snapshot['today_settled'] = round(snapshot['today_settled'] + settled, 2)
+                    self._publish(snapshot)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.resync_interval)
+            except asyncio.TimeoutError:
+                pass
+            # 合并窗口：短时间内的多次写入只推送一次
+            await asyncio.sleep(self.min_interval)
+            self._wakeup.clear()
+
+stats_broadcaster = StatsBroadcaster()
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from ..database.models import User
+from ..database.session import SessionLocal
+from ..database.upsert import upsert_statement
+from ..utils.registration_cache import registration_time_cache
+
+logger = logging.getLogger(__name__)
+
+# 允许同步的Telegram用户资料字段
+PROFILE_FIELDS = ('username', 'first_name', 'last_name', 'is_active')
+
+
+class UserProfileSyncer:
+    """合并Telegram用户资料更新，定期批量upsert到users表
+
+    同一用户在一个刷新周期内的多次更新只保留各字段的最新值，
+    每个周期按字段组合分组，一组一条 INSERT ... ON CONFLICT 语句。
+    """
+
+    def __init__(self, session_factory=SessionLocal, flush_interval: float = 2.0, max_batch: int = 1000):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval  # 刷新周期（秒）
+        self.max_batch = max_batch            # 待写入用户数达到该值时提前刷新
+        self._pending: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_rows = 0
+        self.coalesced_updates = 0
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def submit(self, telegram_id: str, **fields):
+        # 只合并显式传入的字段，未传入的字段保持数据库中的原值
+        updates = {k: v for k, v in fields.items() if k in PROFILE_FIELDS and v is not None}
+        with self._lock:
+            entry = self._pending.get(str(telegram_id))
+            if entry is None:
+                self._pending[str(telegram_id)] = updates
+            else:
+                entry.update(updates)
+                self.coalesced_updates += 1
+            full = len(self._pending) >= self.max_batch
+        self._ensure_started()
+        if full and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（如脚本调用），由调用方自行 flush()
+            return
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        now = datetime.now()
+        # 按更新字段组合分组，保证同组内每行的ON CONFLICT更新列一致
+        groups: Dict[tuple, list] = {}
+        for telegram_id, updates in pending.items():
+            columns = tuple(sorted(updates))
+            groups.setdefault(columns, []).append(
+                dict(updates, telegram_id=telegram_id, created_at=now, updated_at=now))
+        db = self.session_factory()
+        try:
+            dialect_name = db.get_bind().dialect.name
+            for columns, rows in groups.items():
+                db.execute(upsert_statement(User, dialect_name, [User.telegram_id], columns + ('updated_at',)), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 写入失败时放回队列，已有的更新较新，不覆盖
+            with self._lock:
+                for telegram_id, updates in pending.items():
+                    self._pending[telegram_id] = dict(updates, **self._pending.get(telegram_id, {}))
+            raise
+        finally:
+            db.close()
+        # 新用户插入后注册时间已确定，清除缓存中“用户不存在”的记录
+        registration_time_cache.invalidate(pending.keys())
+        self.flushed_rows += len(pending)
+        return len(pending)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f'用户资料批量同步失败：{e}')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+
+user_profile_syncer = UserProfileSyncer()
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Telegram机器人流量模拟器：按会话回放 /invite/generate、/register、/order/complete 调用，
+# 用于在没有真实Telegram连接的情况下做容量评估。
+#
+# 用法（在仓库根目录执行，服务以 uvicorn back.main:app 启动）：
+#   python -m back.tools.load_simulator --duration 60 --rate 20                 # 进程内直接压测FastAPI应用
+#   python -m back.tools.load_simulator --base-url http://127.0.0.1:8000 ...    # 压测本地已启动的服务
+
+WRITE_ENDPOINTS = ('/invite/generate', '/register', '/order/complete')
+
+# 进程内模式下目录库缺少佣金配置时写入的默认值（/order/complete 依赖这些配置）
+DEFAULT_COMMISSION_CONFIG = {'base_rate': '0.1', 'max_level': '3'}
+DEFAULT_COMMISSION_RATE = 0.1
+
+# 当前请求所属接口（进程内模式下用于把锁等待归属到具体接口）
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar('current_endpoint', default='-')
+
+
+class SimulationConfig:
+    def __init__(self,
+                 duration: float = 30.0,
+                 rate: float = 10.0,
+                 burst_every: float = 0.0,
+                 burst_length: float = 5.0,
+                 burst_factor: float = 5.0,
+                 root_ratio: float = 0.1,
+                 invite_prob: float = 0.3,
+                 max_orders: int = 3,
+                 min_amount: float = 10.0,
+                 max_amount: float = 500.0,
+                 think_time: float = 0.2,
+                 max_sessions: int = 500,
+                 seed: Optional[int] = None):
+        self.duration = duration            # 压测时长（秒）
+        self.rate = rate                    # 平均会话到达率（个/秒，泊松过程）
+        self.burst_every = burst_every      # 突发间隔（秒），0表示不模拟突发
+        self.burst_length = burst_length    # 每次突发持续时长（秒）
+        self.burst_factor = burst_factor    # 突发期间到达率倍数
+        self.root_ratio = root_ratio        # 新会话作为新根节点（新邀请树）的概率
+        self.invite_prob = invite_prob      # 注册后转发所用邀请链接的概率（该链接被更多新会话选中，控制树的增长）
+        self.max_orders = max_orders        # 单个会话最多下单数
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.think_time = think_time        # 会话内两次操作之间的平均间隔（秒）
+        self.max_sessions = max_sessions    # 同时在途的会话上限
+        self.seed = seed
+
+    def arrival_rate(self, elapsed: float) -> float:
+        if self.burst_every > 0 and elapsed % self.burst_every < self.burst_length:
+            return self.rate * self.burst_factor
+        return self.rate
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.status_codes: Dict[int, int] = {}
+        self.lock_waits = 0    # 写语句执行时间超过阈值的次数（等待SQLite写锁）
+        self.lock_errors = 0   # 'database is locked' 错误次数
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, pct: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class LockWaitMonitor:
+    """监听SQLAlchemy引擎事件，按接口统计写锁等待与锁超时次数（仅进程内模式可用）"""
+
+    def __init__(self, engine: Engine, stats: Dict[str, EndpointStats], threshold_ms: float = 50.0):
+        self.engine = engine
+        self.stats = stats
+        self.threshold = threshold_ms / 1000
+
+    def _endpoint_stats(self) -> EndpointStats:
+        return self.stats.setdefault(current_endpoint.get(), EndpointStats())
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._lock_wait_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_lock_wait_start', None)
+        if started is None:
+            return
+        if statement.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE') \
+                and time.perf_counter() - started >= self.threshold:
+            self._endpoint_stats().lock_waits += 1
+
+    def _handle_error(self, exception_context):
+        if 'database is locked' in str(exception_context.original_exception):
+            self._endpoint_stats().lock_errors += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_execute)
+        event.listen(self.engine, 'handle_error', self._handle_error)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_execute)
+        event.remove(self.engine, 'handle_error', self._handle_error)
+
+
+class BotTrafficSimulator:
+    def __init__(self, client: httpx.AsyncClient, config: SimulationConfig):
+        self.client = client
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.stats: Dict[str, EndpointStats] = {path: EndpointStats() for path in WRITE_ENDPOINTS}
+        # 已生成的邀请码池，新会话从中挑选链接注册，模拟邀请树的增长
+        self.link_codes: List[str] = []
+        self.sessions_started = 0
+
+    async def _call(self, path: str, params: dict) -> Optional[dict]:
+        token = current_endpoint.set(path)
+        stats = self.stats.setdefault(path, EndpointStats())
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(path, params=params)
+            status_code = response.status_code
+        except httpx.HTTPError:
+            response, status_code = None, 0
+        finally:
+            current_endpoint.reset(token)
+        stats.latencies.append(time.perf_counter() - started)
+        stats.status_codes[status_code] = stats.status_codes.get(status_code, 0) + 1
+        if response is None or status_code >= 400:
+            stats.errors += 1
+            # 远程模式下无法监听引擎事件，只能从错误响应中识别锁超时
+            if response is not None and 'database is locked' in response.text:
+                stats.lock_errors += 1
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    async def _think(self):
+        if self.config.think_time > 0:
+            await asyncio.sleep(self.random.expovariate(1 / self.config.think_time))
+
+    async def _generate_link(self, user_id: str):
+        result = await self._call('/invite/generate', {'inviter_id': user_id})
+        if result and result.get('link_code'):
+            self.link_codes.append(result['link_code'])
+
+    async def run_session(self):
+        # 一个会话对应一个Telegram用户：加入邀请树（或自建新树）、可能继续邀请他人、随后下单
+        cfg = self.config
+        user_id = str(self.random.randint(10 ** 8, 10 ** 10))
+        if not self.link_codes or self.random.random() < cfg.root_ratio:
+            await self._generate_link(user_id)
+        else:
+            link_code = self.random.choice(self.link_codes)
+            if await self._call('/register', {'invitee_id': user_id, 'link_code': link_code}) is None:
+                return
+            # /invite/generate 只为尚未加入邀请树的用户创建根链接，已注册用户转发其注册所用的链接
+            if self.random.random() < cfg.invite_prob:
+                self.link_codes.append(link_code)
+        for _ in range(self.random.randint(0, cfg.max_orders)):
+            await self._think()
+            amount = round(self.random.uniform(cfg.min_amount, cfg.max_amount), 2)
+            await self._call('/order/complete', {'invitee_id': user_id, 'order_amount': amount})
+
+    async def run(self) -> Dict[str, EndpointStats]:
+        cfg = self.config
+        limiter = asyncio.Semaphore(cfg.max_sessions)
+        tasks = set()
+
+        async def _guarded():
+            try:
+                await self.run_session()
+            finally:
+                limiter.release()
+
+        started = time.perf_counter()
+        while True:
+            elapsed = time.perf_counter() - started
+            if elapsed >= cfg.duration:
+                break
+            await asyncio.sleep(self.random.expovariate(cfg.arrival_rate(elapsed)))
+            await limiter.acquire()
+            self.sessions_started += 1
+            task = asyncio.create_task(_guarded())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.stats
+
+
+def ensure_commission_config(session_factory) -> List[str]:
+    # 补齐佣金配置与比例历史（只写入缺失项），返回写入的内容
+    from ..database.models import CommissionConfig, CommissionRateHistory
+    db = session_factory()
+    try:
+        seeded = []
+        existing = {key for key, in db.query(CommissionConfig.key)}
+        for key, value in DEFAULT_COMMISSION_CONFIG.items():
+            if key not in existing:
+                db.add(CommissionConfig(key=key, value=value, description='压测默认配置'))
+                seeded.append(f'{key}={value}')
+        if db.query(CommissionRateHistory.id).first() is None:
+            db.add(CommissionRateHistory(admin_id='load_simulator', rate=DEFAULT_COMMISSION_RATE,
+                                         effective_at=datetime.now() - timedelta(minutes=1),
+                                         description='压测默认比例'))
+            seeded.append(f'rate={DEFAULT_COMMISSION_RATE}')
+        db.commit()
+        return seeded
+    finally:
+        db.close()
+
+
+def format_report(stats: Dict[str, EndpointStats], wall_time: float, sessions: int) -> str:
+    lines = [
+        f'会话数: {sessions}  耗时: {wall_time:.1f}s',
+        f'{"endpoint":<20}{"count":>8}{"rps":>8}{"p50(ms)":>10}{"p99(ms)":>10}{"max(ms)":>10}'
+        f'{"err%":>8}{"lock_wait":>11}{"lock_err":>10}',
+    ]
+    for path, s in stats.items():
+        if not s.count:
+            continue
+        error_rate = s.errors / s.count * 100
+        lines.append(
+            f'{path:<20}{s.count:>8}{s.count / wall_time:>8.1f}{s.percentile(50) * 1000:>10.1f}'
+            f'{s.percentile(99) * 1000:>10.1f}{max(s.latencies) * 1000:>10.1f}'
+            f'{error_rate:>7.1f}%{s.lock_waits:>11}{s.lock_errors:>10}'
+        )
+        codes = ', '.join(f'{code}={n}' for code, n in sorted(s.status_codes.items()))
+        lines.append(f'{"":<20}status: {codes}')
+    return '\n'.join(lines)
+
+
+async def simulate(config: SimulationConfig, base_url: Optional[str] = None,
+                   lock_threshold_ms: float = 50.0) -> str:
+    started = time.perf_counter()
+    notes = []
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            simulator = BotTrafficSimulator(client, config)
+            stats = await simulator.run()
+    else:
+        # 进程内模式：直接通过ASGI调用应用，同时监听各分片的写引擎统计锁等待
+        from ..main import app
+        from ..database.sharding import shard_router
+        seeded = ensure_commission_config(shard_router.directory_session_factory)
+        if seeded:
+            notes.append(f'目录库缺少佣金配置，已写入默认值：{", ".join(seeded)}')
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=30) as client:
+            simulator = BotTrafficSimulator(client, config)
+            with contextlib.ExitStack() as stack:
+                for shard in shard_router.shards:
+                    stack.enter_context(LockWaitMonitor(shard.engine, simulator.stats, lock_threshold_ms))
+                stats = await simulator.run()
+    return '\n'.join(notes + [format_report(stats, time.perf_counter() - started, simulator.sessions_started)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Telegram机器人流量模拟与压测工具')
+    parser.add_argument('--base-url', default=None, help='目标服务地址，不填则进程内压测')
+    parser.add_argument('--duration', type=float, default=30.0, help='压测时长（秒）')
+    parser.add_argument('--rate', type=float, default=10.0, help='平均会话到达率（个/秒）')
+    parser.add_argument('--burst-every', type=float, default=0.0, help='突发间隔（秒），0为关闭')
+    parser.add_argument('--burst-length', type=float, default=5.0, help='突发持续时长（秒）')
+    parser.add_argument('--burst-factor', type=float, default=5.0, help='突发期间到达率倍数')
+    parser.add_argument('--root-ratio', type=float, default=0.1, help='新会话自建邀请树的概率')
+    parser.add_argument('--invite-prob', type=float, default=0.3, help='注册后转发邀请链接的概率')
+    parser.add_argument('--max-orders', type=int, default=3, help='单会话最多下单数')
+    parser.add_argument('--think-time', type=float, default=0.2, help='会话内操作平均间隔（秒）')
+    parser.add_argument('--max-sessions', type=int, default=500, help='同时在途会话上限')
+    parser.add_argument('--lock-threshold-ms', type=float, default=50.0, help='判定为锁等待的写语句耗时阈值')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    config = SimulationConfig(
+        duration=args.duration,
+        rate=args.rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        burst_factor=args.burst_factor,
+        root_ratio=args.root_ratio,
+        invite_prob=args.invite_prob,
+        max_orders=args.max_orders,
+        think_time=args.think_time,
+        max_sessions=args.max_sessions,
+        seed=args.seed,
+    )
+    print(asyncio.run(simulate(config, args.base_url, args.lock_threshold_ms)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from ..database.models import Base, InviteLinkTree, CommissionRecord, SettlementRecord
+from ..repositories.commission_record_repository import CommissionRecordRepository
+from ..repositories.settlement_record_repository import SettlementRecordRepository
+from ..schemas.commission import PageRequest
+
+# 查询计划回归检查：在预置数据的SQLite库上对每个仓储方法执行 EXPLAIN QUERY PLAN，
+# 只接受 SEARCH（按索引定位）；任何 SCAN（包括 SCAN ... USING INDEX 的全索引扫描）都判定失败（退出码1），
+# 除非在 ALLOWED_SCANS 中显式列出。同时用预置数据独立计算期望值，校验关键查询的结果。
+# 新增仓储方法时必须在 CASES 中补充用例。
+#
+# 用法（在仓库根目录执行）：python -m back.tools.query_plan_check
+
+SEED_USERS = 500
+SEED_INVITEES = 3000
+SEED_COMMISSIONS = 10000
+SEED_SETTLEMENTS = 800
+
+# 本身就需要遍历全部链接的查询，允许对指定表做扫描（全表或全索引）：(方法名, 表名)
+ALLOWED_SCANS = {
+    ('get_all_links', 'invite_link_tree'),
+    ('get_all_links', 'commission_records'),  # 按链接汇总佣金的子查询（覆盖索引）
+    ('get_total_link_count', 'invite_link_tree'),
+}
+
+SAMPLE_USER = 'user_1'
+SAMPLE_LINK = 'link_1'
+
+CASES: List[Tuple[str, str, Callable]] = [
+    ('CommissionRecordRepository', 'get_total_link_count', lambda c, s: c.get_total_link_count()),
+    ('CommissionRecordRepository', 'get_today_commission', lambda c, s: c.get_today_commission()),
+    ('CommissionRecordRepository', 'get_today_settled_commission', lambda c, s: c.get_today_settled_commission()),
+    ('CommissionRecordRepository', 'get_user_links', lambda c, s: c.get_user_links(SAMPLE_USER, PageRequest())),
+    ('CommissionRecordRepository', 'get_user_links', lambda c, s: c.get_user_links(
+        SAMPLE_USER, PageRequest(keyword='link', start_date=datetime.now() - timedelta(days=7), end_date=datetime.now()))),
+    ('CommissionRecordRepository', 'get_link_commission_detail', lambda c, s: c.get_link_commission_detail(SAMPLE_LINK)),
+    ('CommissionRecordRepository', 'get_all_links', lambda c, s: c.get_all_links(PageRequest())),
+    ('CommissionRecordRepository', 'get_all_links', lambda c, s: c.get_all_links(PageRequest(keyword='user_1'))),
+    ('CommissionRecordRepository', 'get_paginated_settlement_history',
+     lambda c, s: c.get_paginated_settlement_history(SAMPLE_USER, 1, 10)),
+    ('CommissionRecordRepository', 'get_available_commission', lambda c, s: c.get_available_commission(SAMPLE_USER)),
+    ('SettlementRecordRepository', 'get_by_user', lambda c, s: s.get_by_user(SAMPLE_USER)),
+]
+
+REPOSITORIES = {
+    'CommissionRecordRepository': CommissionRecordRepository,
+    'SettlementRecordRepository': SettlementRecordRepository,
+}
+
+_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+def seed(db):
+    rnd = random.Random(42)
+    now = datetime.now()
+    nodes = []
+    for i in range(SEED_USERS):
+        nodes.append(InviteLinkTree(id=i + 1, inviter_id=f'user_{i}', invitee_id=f'user_{i}',
+                                    link_code=f'link_{i}', parent_id=None,
+                                    created_at=now - timedelta(days=rnd.randint(0, 30))))
+    # 每个用户拥有一个链接码；与 /register 一致，被邀请者节点记录其注册所用的邀请者链接码
+    owned = {node.invitee_id: node.link_code for node in nodes}
+    for i in range(SEED_INVITEES):
+        parent = rnd.choice(nodes)
+        owned.setdefault(parent.invitee_id, f'sub_{parent.invitee_id}')
+        node = InviteLinkTree(id=len(nodes) + 1, inviter_id=parent.invitee_id, invitee_id=f'invitee_{i}',
+                              link_code=owned[parent.invitee_id], parent_id=parent.id,
+                              created_at=now - timedelta(days=rnd.randint(0, 30)))
+        nodes.append(node)
+    db.add_all(nodes)
+    db.flush()
+    settlements = [SettlementRecord(id=i + 1, user_id=f'user_{rnd.randrange(SEED_USERS)}',
+                                    total_amount=rnd.uniform(10, 500), status='completed',
+                                    created_at=now - timedelta(days=rnd.randint(0, 30)),
+                                    completed_at=now - timedelta(days=rnd.randint(0, 30)))
+                   for i in range(SEED_SETTLEMENTS)]
+    db.add_all(settlements)
+    db.flush()
+    records = []
+    for i in range(SEED_COMMISSIONS):
+        node = rnd.choice(nodes)
+        settled = rnd.random() < 0.4
+        records.append(CommissionRecord(
+            inviter_id=node.inviter_id, invitee_id=node.invitee_id, amount=round(rnd.uniform(1, 50), 2),
+            order_id=f'order_{i}', status='confirmed', used_rate=0.1, link_code=node.link_code,
+            is_settled=1 if settled else 0,
+            settlement_id=rnd.randint(1, SEED_SETTLEMENTS) if settled else None,
+            created_at=now - timedelta(days=rnd.randint(0, 30))))
+    db.add_all(records)
+    db.commit()
+    db.execute(text('ANALYZE'))
+    return nodes, settlements, records
+
+
+def _close(actual, expected) -> bool:
+    return abs((actual or 0.0) - expected) < 0.01
+
+
+def check_results(commission_repo: CommissionRecordRepository, nodes, settlements, records) -> List[str]:
+    # 期望值直接由预置数据在Python中计算，不依赖被检查的SQL
+    failures = []
+    today = datetime.combine(datetime.today().date(), datetime.min.time())
+    link_records = [r for r in records if r.link_code == SAMPLE_LINK]
+    link_total = sum(r.amount for r in link_records)
+    link_settled = sum(r.amount for r in link_records if r.is_settled == 1)
+
+    detail = commission_repo.get_link_commission_detail(SAMPLE_LINK)
+    if not (_close(detail['total_commission'], link_total) and _close(detail['settled_commission'], link_settled)):
+        failures.append(f'get_link_commission_detail 结果错误：{detail}，期望总额 {link_total:.2f}、已结算 {link_settled:.2f}')
+
+    if len(detail['records']) != min(len(link_records), 100):
+        failures.append(f'get_link_commission_detail 明细条数错误：{len(detail["records"])}，期望 {len(link_records)}')
+
+    user_links, _ = commission_repo.get_user_links(SAMPLE_USER, PageRequest(page_size=100))
+    user_row = next((link for link in user_links if link['link_code'] == SAMPLE_LINK), None)
+    if user_row is None or not (_close(user_row['total_commission'], link_total)
+                                and _close(user_row['settled_commission'], link_settled)):
+        failures.append(f'get_user_links 结果错误：{user_row}，期望总额 {link_total:.2f}、已结算 {link_settled:.2f}')
+
+    links, _ = commission_repo.get_all_links(PageRequest(keyword=SAMPLE_LINK, page_size=100))
+    row = next((link for link in links if link['link_code'] == SAMPLE_LINK), None)
+    link_nodes = sum(1 for node in nodes if node.link_code == SAMPLE_LINK)
+    if row is None or not (_close(row['total_commission'], link_total)
+                           and _close(row['settled_commission'], link_settled)
+                           and row['invitee_count'] == link_nodes):
+        failures.append(f'get_all_links 结果错误：{row}，期望总额 {link_total:.2f}、已结算 {link_settled:.2f}、'
+                        f'邀请人数 {link_nodes}')
+
+    available = sum(r.amount for r in records if r.inviter_id == SAMPLE_USER and r.is_settled == 0)
+    actual = commission_repo.get_available_commission(SAMPLE_USER)
+    if not _close(actual, available):
+        failures.append(f'get_available_commission 结果错误：{actual}，期望 {available:.2f}')
+
+    today_commission = sum(r.amount for r in records if r.created_at >= today)
+    actual = commission_repo.get_today_commission()
+    if not _close(actual, today_commission):
+        failures.append(f'get_today_commission 结果错误：{actual}，期望 {today_commission:.2f}')
+
+    today_settled = sum(s.total_amount for s in settlements if s.completed_at >= today)
+    actual = commission_repo.get_today_settled_commission()
+    if not _close(actual, today_settled):
+        failures.append(f'get_today_settled_commission 结果错误：{actual}，期望 {today_settled:.2f}')
+
+    link_count = len({node.link_code for node in nodes})
+    actual = commission_repo.get_total_link_count()
+    if actual != link_count:
+        failures.append(f'get_total_link_count 结果错误：{actual}，期望 {link_count}')
+    return failures
+
+
+def check_coverage() -> List[str]:
+    covered = {(repo, method) for repo, method, _ in CASES}
+    missing = []
+    for name, cls in REPOSITORIES.items():
+        for attr in dir(cls):
+            if not attr.startswith('_') and callable(getattr(cls, attr)) and (name, attr) not in covered:
+                missing.append(f'{name}.{attr} 缺少查询计划用例')
+    return missing
+
+
+def run(url: str = 'sqlite://') -> int:
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    nodes, settlements, records = seed(session)
+
+    captured: List[Tuple[str, tuple]] = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    failures = check_coverage()
+    commission_repo = CommissionRecordRepository(session)
+    settlement_repo = SettlementRecordRepository(session)
+    plans: Dict[str, List[str]] = {}
+    for repo_name, method, call in CASES:
+        captured.clear()
+        event.listen(engine, 'before_cursor_execute', _capture)
+        try:
+            call(commission_repo, settlement_repo)
+        except Exception as e:
+            failures.append(f'{repo_name}.{method} 执行失败：{e}')
+            continue
+        finally:
+            event.remove(engine, 'before_cursor_execute', _capture)
+        for statement, parameters in captured:
+            rows = session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+            details = [row[-1] for row in rows]
+            plans.setdefault(f'{repo_name}.{method}', []).extend(details)
+            for detail in details:
+                match = _SCAN_PATTERN.match(detail)
+                if not match:
+                    continue
+                table = match.group(1)
+                if table in Base.metadata.tables and (method, table) not in ALLOWED_SCANS:
+                    failures.append(f'{repo_name}.{method} 扫描 {table}（{detail}）：{statement.strip()}')
+    failures.extend(check_results(commission_repo, nodes, settlements, records))
+    session.close()
+
+    for name, details in plans.items():
+        print(name)
+        for detail in details:
+            print(f'    {detail}')
+    if failures:
+        print('\n查询计划退化：')
+        for failure in failures:
+            print(f'  - {failure}')
+        return 1
+    print('\n所有仓储查询均命中索引，结果校验通过')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
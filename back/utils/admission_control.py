@@ -0,0 +1,197 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import anyio
+
+
+class AdmissionLimit:
+    """单个接口（或接口类别）的并发上限 + 有界等待队列
+
+    并发已满时请求进入等待队列，队列已满或等待超时则立即拒绝，
+    避免请求在SQLite写锁后无限堆积。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout  # 排队最长等待时间（秒）
+        self.active = 0
+        self._waiters: deque = deque()
+        # 计数器
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.peak_waiting = 0
+        self.avg_latency = 0.0  # 请求处理耗时的指数加权平均（秒），用于估算Retry-After
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.peak_waiting = max(self.peak_waiting, len(self._waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # 超时的同时刚好获得名额，直接使用
+                self.admitted += 1
+                return True
+            waiter.cancel()
+            self._waiters.remove(waiter)
+            self.rejected_timeout += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self, elapsed: Optional[float] = None):
+        if elapsed is not None:
+            self.avg_latency = elapsed if not self.avg_latency else self.avg_latency * 0.9 + elapsed * 0.1
+        # 名额直接移交给队首等待者，保证先到先得；并发上限被调小时先回收名额
+        while self._waiters and self.active <= self.max_concurrency:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def retry_after(self) -> int:
+        # 按当前排队长度与平均处理耗时估算需要等待的秒数
+        estimate = (self.waiting + 1) / max(self.max_concurrency, 1) * self.avg_latency
+        return max(1, math.ceil(estimate))
+
+    def stats(self) -> dict:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'active': self.active,
+            'waiting': self.waiting,
+            'peak_waiting': self.peak_waiting,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_timeout': self.rejected_timeout,
+            'avg_latency_ms': round(self.avg_latency * 1000, 2),
+        }
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+class AdmissionController:
+    """按接口路由到对应的AdmissionLimit：热点写接口独立限流，其余按读/写类别共享限流"""
+
+    # 不做准入控制的路径（长连接推送、准入控制自身的管理接口）
+    EXEMPT_PREFIXES = ('/link/stats/stream', '/admin/admission')
+
+    def __init__(self):
+        # 写接口在SQLite单写锁上串行，并发上限小、排队短，超出时快速失败
+        self.limits: Dict[str, AdmissionLimit] = {
+            '/register': AdmissionLimit(
+                '/register',
+                _env_int('ADMISSION_REGISTER_CONCURRENCY', 4),
+                _env_int('ADMISSION_REGISTER_QUEUE', 50),
+                _env_float('ADMISSION_REGISTER_TIMEOUT', 2.0)),
+            '/order/complete': AdmissionLimit(
+                '/order/complete',
+                _env_int('ADMISSION_ORDER_CONCURRENCY', 4),
+                _env_int('ADMISSION_ORDER_QUEUE', 100),
+                _env_float('ADMISSION_ORDER_TIMEOUT', 2.0)),
+            'write': AdmissionLimit(
+                'write',
+                _env_int('ADMISSION_WRITE_CONCURRENCY', 4),
+                _env_int('ADMISSION_WRITE_QUEUE', 50),
+                _env_float('ADMISSION_WRITE_TIMEOUT', 2.0)),
+            # 读接口走读库连接池，允许更高并发和更长排队
+            'read': AdmissionLimit(
+                'read',
+                _env_int('ADMISSION_READ_CONCURRENCY', 32),
+                _env_int('ADMISSION_READ_QUEUE', 200),
+                _env_float('ADMISSION_READ_TIMEOUT', 5.0)),
+        }
+
+    def limit_for(self, method: str, path: str) -> Optional[AdmissionLimit]:
+        if path.startswith(self.EXEMPT_PREFIXES):
+            return None
+        if path in self.limits:
+            return self.limits[path]
+        return self.limits['read' if method in ('GET', 'HEAD', 'OPTIONS') else 'write']
+
+    def update(self, name: str, max_concurrency: int = None, max_queue: int = None,
+               queue_timeout: float = None) -> AdmissionLimit:
+        limit = self.limits.get(name)
+        if limit is None:
+            raise KeyError(name)
+        if max_concurrency is not None:
+            if max_concurrency < 1:
+                raise ValueError('并发上限必须大于0')
+            increase = max_concurrency - limit.max_concurrency
+            limit.max_concurrency = max_concurrency
+            # 调大并发时唤醒排队中的请求
+            for _ in range(max(0, increase)):
+                if not limit._waiters:
+                    break
+                limit.active += 1
+                limit.release()
+        if max_queue is not None:
+            if max_queue < 0:
+                raise ValueError('队列长度不能为负数')
+            limit.max_queue = max_queue
+        if queue_timeout is not None:
+            if queue_timeout < 0:
+                raise ValueError('排队超时不能为负数')
+            limit.queue_timeout = queue_timeout
+        return limit
+
+    def stats(self) -> dict:
+        return {name: limit.stats() for name, limit in self.limits.items()}
+
+    def ensure_thread_capacity(self):
+        # 同步接口在线程池中执行：线程池容量不低于各限流并发上限之和，
+        # 否则已准入的写请求可能排在读请求之后等待线程（需在事件循环中调用）
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        limiter.total_tokens = max(limiter.total_tokens,
+                                   sum(limit.max_concurrency for limit in self.limits.values()))
+
+
+admission_controller = AdmissionController()
+
+
+async def admit(limit: AdmissionLimit, call, *args):
+    # 获取名额后执行call，返回(是否准入, call结果)
+    if not await limit.acquire():
+        return False, None
+    started = time.perf_counter()
+    try:
+        return True, await call(*args)
+    finally:
+        limit.release(time.perf_counter() - started)
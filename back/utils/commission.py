@@ -1,12 +1,16 @@
 from sqlalchemy.orm import Session
-from ..database.models import CommissionRecord, InviteLinkTree, CommissionConfig, CommissionRateHistory, User
+from ..database.models import CommissionRecord, InviteLinkTree, CommissionConfig, CommissionRateHistory
+from ..database.session import SessionLocal
+from .registration_cache import registration_time_cache
 from datetime import datetime
 
 def calculate_commission(db: Session, invitee_id: str, order_amount: float, order_time: datetime, order_id: str = None):
     """计算佣金并创建佣金记录
     
+    佣金配置与比例历史是全局数据，只存放在目录库（0号分片）中；db 属于其他分片时使用独立的会话读取。
+
     Args:
-        db: 数据库会话
+        db: 数据库会话（被邀请者所在分片）
         invitee_id: 被邀请者ID
         order_amount: 订单金额
         order_time: 订单时间
@@ -20,9 +24,28 @@ def calculate_commission(db: Session, invitee_id: str, order_amount: float, orde
     if not current_node:
         return []
     
-    # 获取佣金配置
-    base_rate_config = db.query(CommissionConfig).filter(CommissionConfig.key == 'base_rate').first()
-    max_level_config = db.query(CommissionConfig).filter(CommissionConfig.key == 'max_level').first()
+    # 获取被邀请者注册时间（优先读缓存）
+    invitee_created_at = registration_time_cache.get(invitee_id)
+    if invitee_created_at is None:
+        # 如果用户不存在，使用默认时间
+        invitee_created_at = datetime.now()
+
+    # 确定计算佣金的时间基准
+    calculate_time = max(order_time, invitee_created_at)
+
+    config_db = db if db.info.get('shard', 0) == 0 else SessionLocal()
+    try:
+        # 获取佣金配置
+        base_rate_config = config_db.query(CommissionConfig).filter(CommissionConfig.key == 'base_rate').first()
+        max_level_config = config_db.query(CommissionConfig).filter(CommissionConfig.key == 'max_level').first()
+        # 查询该时间点最近生效的佣金比例（各层级使用同一时间基准，只需查询一次）
+        rate_record = config_db.query(CommissionRateHistory) \
+                               .filter(CommissionRateHistory.effective_at <= calculate_time) \
+                               .order_by(CommissionRateHistory.effective_at.desc()) \
+                               .first()
+    finally:
+        if config_db is not db:
+            config_db.close()
     
     if not base_rate_config or not max_level_config:
         raise ValueError('佣金配置不完整')
@@ -39,18 +62,16 @@ def calculate_commission(db: Session, invitee_id: str, order_amount: float, orde
         raise ValueError('基础佣金比例必须在0-1之间')
     if max_level < 1 or max_level > 10:
         raise ValueError('最大层级必须在1-10之间')
+
+    if not rate_record:
+        raise ValueError('无有效的佣金比例配置')
+
+    # 使用历史比例计算佣金
+    used_rate = rate_record.rate
     
     level = 0
     records = []
     
-    # 获取被邀请者信息
-    invitee = db.query(User).filter(User.telegram_id == invitee_id).first()
-    if not invitee:
-        # 如果用户不存在，使用默认时间
-        invitee_created_at = datetime.now()
-    else:
-        invitee_created_at = invitee.created_at
-    
     # 从当前节点开始向上遍历父节点
     while current_node and level < max_level:
         # 上级邀请者ID
@@ -59,21 +80,6 @@ def calculate_commission(db: Session, invitee_id: str, order_amount: float, orde
         # 计算当前层级佣金（每层级递减10%）
         commission = order_amount * base_rate * (0.9 ** level)
         
-        # 确定计算佣金的时间基准
-        calculate_time = max(order_time, invitee_created_at)
-        
-        # 查询该时间点最近生效的佣金比例
-        rate_record = db.query(CommissionRateHistory) \
-                        .filter(CommissionRateHistory.effective_at <= calculate_time) \
-                        .order_by(CommissionRateHistory.effective_at.desc()) \
-                        .first()
-        
-        if not rate_record:
-            raise ValueError('无有效的佣金比例配置')
-        
-        # 使用历史比例计算佣金
-        used_rate = rate_record.rate
-        
         # 确保所有必填字段都有值
         safe_order_id = str(order_id) if order_id is not None else f'ORDER_{datetime.now().strftime("%Y%m%d%H%M%S")}'
         safe_link_code = str(current_node.link_code) if current_node.link_code else f'LINK_{inviter_id}'
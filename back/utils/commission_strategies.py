@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from sqlalchemy.orm import Session
-from database.models import SettlementRecord, CommissionRecord
+from ..database.models import SettlementRecord, CommissionRecord
 
 class CommissionStrategy(ABC):
     @abstractmethod
@@ -17,7 +17,7 @@ class DefaultSettlementStrategy(CommissionStrategy):
         db.query(CommissionRecord) \
           .filter(CommissionRecord.inviter_id == user_id) \
           .filter(CommissionRecord.is_settled == 0) \
-          .update({CommissionRecord.is_settled: 1})
+          .update({CommissionRecord.is_settled: 1, CommissionRecord.settlement_id: settlement.id})
         return settlement
 
 # 示例：阶梯式结算
@@ -32,7 +32,7 @@ class StepSettlementStrategy(CommissionStrategy):
         db.query(CommissionRecord) \
           .filter(CommissionRecord.inviter_id == user_id) \
           .filter(CommissionRecord.is_settled == 0) \
-          .update({CommissionRecord.is_settled: 1})
+          .update({CommissionRecord.is_settled: 1, CommissionRecord.settlement_id: settlement.id})
         return settlement
 
 # 更新工厂函数
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from ..database.models import User
+from ..database.session import SessionLocal
+
+_MISSING = object()
+
+
+class RegistrationTimeCache:
+    """有界LRU缓存：telegram_id -> 注册时间（用户不存在时缓存None，避免每笔订单都查users表）
+
+    users表是全局数据，只存放在目录库（0号分片）中，因此使用独立的会话查询。
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_size: int = 50000):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, Optional[datetime]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: str) -> Optional[datetime]:
+        key = str(telegram_id)
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        db = self.session_factory()
+        try:
+            row = db.query(User.created_at).filter(User.telegram_id == key).first()
+        finally:
+            db.close()
+        value = row.created_at if row else None
+        self.put(key, value)
+        return value
+
+    def put(self, telegram_id: str, created_at: Optional[datetime]):
+        with self._lock:
+            self._entries[str(telegram_id)] = created_at
+            self._entries.move_to_end(str(telegram_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # 用户表发生变更后调用（如批量同步新增了用户），使对应缓存失效
+    def invalidate(self, telegram_ids: Iterable[str]):
+        with self._lock:
+            for telegram_id in telegram_ids:
+                self._entries.pop(str(telegram_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+registration_time_cache = RegistrationTimeCache()